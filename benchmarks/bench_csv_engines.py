@@ -0,0 +1,133 @@
+"""Benchmark of the CSV engines of combine_dart_and_ninox_samples_2.py on large synthetic DArT reports and Ninox exports.
+
+For each engine the files are read the same way the script reads them:
+- the DArT report after its header rows, without header (skiprows=row_number, header=None),
+- the Ninox Genetics export with the projection of the Dog survey type from ninox_schema.json.
+Each read runs in a fresh process, so the peak memory (max RSS) of one engine isn't influenced by the others.
+The engines don't fall back to pandas here, a read an engine can't handle is reported as failed instead of timing the pandas engine.
+Engines whose optional dependency is missing are reported as not available.
+
+usage: python benchmarks/bench_csv_engines.py [--markers 50000] [--samples 400] [--ninox-rows 200000] [--repeats 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import resource
+import importlib.util
+import multiprocessing
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import combine_dart_and_ninox_samples_2 as pipeline
+
+
+def write_dart_report(file_path, n_markers, n_samples, n_header_rows=6):
+    """write a synthetic DArT report: n_header_rows rows padded with "*", the AlleleID row with the sample names after "RepAvg"
+    and n_markers rows of genotype calls."""
+    rng = np.random.default_rng(0)
+    marker_columns = ["AlleleID", "CloneID", "AlleleSequence", "TrimmedSequence", "SNP", "SnpPosition", "CallRate", "OneRatioRef",
+                      "OneRatioSnp", "FreqHomRef", "FreqHomSnp", "FreqHets", "PICRef", "PICSnp", "AvgPIC", "AvgCountRef", "AvgCountSnp", "RepAvg"]
+    sample_names = [f"SAMPLE-{sample:05d}" for sample in range(n_samples)]
+    n_columns = len(marker_columns) + n_samples
+    with open(file_path, "w") as f:
+        for _ in range(n_header_rows):
+            f.write(",".join(["*"] * (len(marker_columns) - 1) + [""] * (n_samples + 1)) + "\n")
+        f.write(",".join(marker_columns + sample_names) + "\n")
+        for marker in range(n_markers):
+            marker_values = [f"{marker}|F|0-{marker}", str(marker), "TGCAG" * 10, "TGCAG" * 8, "12:A>G", "12"] + [f"{value:.3f}" for value in rng.random(len(marker_columns) - 6)]
+            calls = rng.integers(0, 3, n_samples).astype(str)
+            f.write(",".join(marker_values) + "," + ",".join(calls) + "\n")
+    return n_header_rows, n_columns
+
+
+def write_ninox_export(file_path, n_rows):
+    """write a synthetic Ninox Genetics export with the columns of the Dog survey type and some unneeded columns."""
+    rng = np.random.default_rng(1)
+    ninox_export = pd.DataFrame({"Projects": rng.choice(["Project A", "Project B"], n_rows),
+                                 "Sample Name": [f"sample-{row:07d}" for row in range(n_rows)],
+                                 "Genetic ID": np.arange(n_rows),
+                                 "Genetic Latitude Pin": -27 - rng.random(n_rows),
+                                 "Genetic Longitude Pin": 153 + rng.random(n_rows),
+                                 "Genetics Survey Type": "Dog",
+                                 "Survey Date": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, n_rows), unit="D"),
+                                 "Council": rng.choice(["Council A", "Council B", "Council C"], n_rows),
+                                 "Scat ID": np.arange(n_rows),
+                                 "Notes": "some notes which are not needed " * 3,
+                                 "Observer": rng.choice(["Observer A", "Observer B"], n_rows)})
+    ninox_export["Survey Date"] = ninox_export["Survey Date"].dt.strftime("%d/%m/%Y")
+    ninox_export.to_csv(file_path, index=False)
+    return
+
+
+def in_projection(projection, column):
+    return column.strip() in projection
+
+
+def run_read(engine, read_name, file_path, read_kwargs, repeats, result_queue):
+    """read file_path repeats times with engine in this process and report the best time and the peak memory,
+    or the error if the engine failed."""
+    timings = []
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            data = pipeline.read_csv_engine(file_path, engine=engine, fallback=False, **read_kwargs)
+            timings.append(time.perf_counter() - start)
+    except Exception as error:
+        result_queue.put({"engine": engine, "read": read_name, "status": f"failed: {type(error).__name__}: {error}"})
+        return
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_memory_mb = max_rss / 1024**2 if sys.platform == "darwin" else max_rss / 1024
+    result_queue.put({"engine": engine, "read": read_name, "status": "ok", "shape": data.shape, "seconds": min(timings),
+                      "MB/s": os.path.getsize(file_path) / 1024**2 / min(timings), "peak_memory_MB": peak_memory_mb})
+    return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the CSV engines on large synthetic DArT reports and Ninox exports.")
+    parser.add_argument("--markers", type=int, default=50000, help="number of marker rows in the DArT report.")
+    parser.add_argument("--samples", type=int, default=400, help="number of sample columns in the DArT report.")
+    parser.add_argument("--ninox-rows", type=int, default=200000, help="number of rows in the Ninox export.")
+    parser.add_argument("--repeats", type=int, default=3, help="number of reads per engine, the best time is reported.")
+    args = parser.parse_args()
+
+    schema_registry = pipeline.ninox_schema_registry(pipeline.ninox_schema_file)
+    projection = schema_registry.get_plan("Dog", "Genetics")["projection"]
+
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        report_file = os.path.join(tmp_folder, "Report_DKo99-0001_SNP.csv")
+        ninox_file = os.path.join(tmp_folder, "4 - Genetics.csv")
+        row_number, _ = write_dart_report(report_file, args.markers, args.samples)
+        write_ninox_export(ninox_file, args.ninox_rows)
+        print(f"DArT report: {os.path.getsize(report_file) / 1024**2:.1f} MB, Ninox export: {os.path.getsize(ninox_file) / 1024**2:.1f} MB\n")
+
+        reads = [("DArT report", report_file, {"skiprows": row_number, "header": None, "low_memory": False}),
+                 ("Ninox export", ninox_file, {"usecols": partial(in_projection, projection)})]
+
+        results = []
+        context = multiprocessing.get_context("spawn")
+        for engine in pipeline.csv_engines:
+            missing_dependencies = [module for module in pipeline.csv_engine_dependencies[engine] if importlib.util.find_spec(module) is None]
+            if len(missing_dependencies) > 0:
+                print(f"{engine}: not available (missing {missing_dependencies})")
+                continue
+            for read_name, file_path, read_kwargs in reads:
+                result_queue = context.Queue()
+                process = context.Process(target=run_read, args=(engine, read_name, file_path, read_kwargs, args.repeats, result_queue))
+                process.start()
+                results.append(result_queue.get())
+                process.join()
+
+    results = pd.DataFrame(results, columns=["engine", "read", "status", "shape", "seconds", "MB/s", "peak_memory_MB"])
+    print(results.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+    return
+
+
+if __name__ == "__main__":
+    main()
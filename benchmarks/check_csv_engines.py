@@ -0,0 +1,123 @@
+"""Check that every CSV engine of combine_dart_and_ninox_samples_2.py returns the same dataframe (values and dtypes) as the pandas engine.
+
+Each engine reads small csv files covering the cases which differ between the parsers (NA strings, empty columns,
+integers with missing values, dates, numeric sample names, a sample literally named "NA", duplicated column names, ragged rows,
+rows with one more field than the header, which pandas reads as index),
+once for every combination of the read options on its allowlist (csv_engine_options), without falling back to pandas.
+A read passes if the engine returns the same dataframe as pandas.read_csv, or if it raises an error
+(then read_csv_engine falls back to the pandas engine in the pipeline). A different dataframe is a failure.
+Engines whose optional dependency is missing are skipped.
+
+usage: python benchmarks/check_csv_engines.py
+"""
+
+import os
+import sys
+import tempfile
+import itertools
+import importlib.util
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import combine_dart_and_ninox_samples_2 as pipeline
+
+
+csv_files = {
+    "ninox_export": ("Projects,Sample Name,Genetic ID,Genetic Latitude Pin,Survey Date,Council,Empty,Notes\n"
+                     "Project A,sample-1,1,-27.5,05/01/2023,Council A,,NA\n"
+                     "Project B,NA,,27.1,06/01/2023,N/A,,null\n"
+                     "Project A,sample-3,3,,2023-01-07,,,\n"
+                     "Project B,1234,4,-28.0,,Council B,,n/a\n"),
+    "ninox_merged": ("Project,Sample.Name,Genetic.ID,Latitude,Survey.Date,Date.Extraction,Dart.Order.Number\n"
+                     "Project A,SAMPLE-1,1,-27.5,2023-01-05,2023-02-01,DKo23-0001\n"
+                     "Project B,SAMPLE-2,,-27.1,2023-01-06,,\n"),
+    "all_dart_data": ("sample_names,dart_order_number,tissue\n"
+                      "SAMPLE-1,DKo23-0001,Scat\n"
+                      "NA,DKo23-0001,NA\n"
+                      "1234,DKo23-0002,\n"),
+    "dart_report": ("*,*,*,,,\n"
+                    "*,*,*,,,\n"
+                    "AlleleID,CloneID,RepAvg,SAMPLE-1,NA,1234\n"
+                    "100|F|0-1,100,0.98,0,1,2\n"
+                    "101|F|0-2,101,0.97,1,,0\n"),
+    "duplicated_columns": ("Sample Name,Sample Name,Notes\n"
+                           "sample-1,sample-1,a\n"),
+    "ragged_rows": ("Sample Name,Notes\n"
+                    "sample-1,a\n"
+                    "sample-2,b,extra\n"),
+    "index_column": ("Sample Name,Notes\n"
+                     "1,sample-1,a\n"
+                     "2,sample-2,b\n"),
+}
+
+# values for each read option on an allowlist, None means the option isn't passed:
+option_values = {"usecols": [None, ["Sample Name", "Sample.Name", "sample_names", "Notes", "tissue", 0, 3], lambda column: str(column).strip() in {"Sample Name", "Notes", "tissue"}],
+                 "header": [None, "no header"],
+                 "skiprows": [None, 2],
+                 "nrows": [None, 1]}
+
+
+def read_kwargs_combinations(engine):
+    """all combinations of the read options on the allowlist of engine."""
+    options = sorted(pipeline.csv_engine_options[engine])
+    for values in itertools.product(*[option_values[option] for option in options]):
+        read_kwargs = {option: value for option, value in zip(options, values) if value is not None}
+        if read_kwargs.get("header") == "no header":
+            read_kwargs["header"] = None
+        yield read_kwargs
+
+
+def check_engine(engine, csv_paths):
+    """compare engine to pandas for every csv file and read option combination, returns the number of failures."""
+    n_failures = 0
+    n_compared = 0
+    for csv_name, csv_path in csv_paths.items():
+        for read_kwargs in read_kwargs_combinations(engine):
+            if isinstance(read_kwargs.get("usecols"), list):
+                # usecols has to match the header, keep only the columns which exist in this file:
+                try:
+                    header_columns = pd.read_csv(csv_path, nrows=0, header=read_kwargs.get("header", "infer"), skiprows=read_kwargs.get("skiprows")).columns
+                except Exception:
+                    header_columns = []
+                read_kwargs["usecols"] = [column for column in read_kwargs["usecols"] if column in header_columns]
+            try:
+                expected = pd.read_csv(csv_path, **read_kwargs)
+            except Exception:
+                expected = None
+            try:
+                result = pipeline.read_csv_engine(csv_path, engine=engine, fallback=False, **read_kwargs)
+            except Exception:
+                # the engine refuses the file, the pipeline reads it with pandas:
+                continue
+            n_compared += 1
+            try:
+                if expected is None:
+                    raise AssertionError("pandas raises an error for this file, but the engine returned data")
+                pd.testing.assert_frame_equal(result, expected, check_dtype=True, check_column_type=False)
+            except AssertionError as error:
+                n_failures += 1
+                print(f"FAIL {engine} {csv_name} {read_kwargs}:\n{error}\n")
+    print(f"{engine}: {n_compared} reads compared to pandas, {n_failures} failures.")
+    return n_failures
+
+
+def main():
+    n_failures = 0
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        csv_paths = {}
+        for csv_name, content in csv_files.items():
+            csv_paths[csv_name] = os.path.join(tmp_folder, f"{csv_name}.csv")
+            with open(csv_paths[csv_name], "w") as f:
+                f.write(content)
+        for engine in pipeline.csv_engine_options:
+            missing_dependencies = [module for module in pipeline.csv_engine_dependencies[engine] if importlib.util.find_spec(module) is None]
+            if len(missing_dependencies) > 0:
+                print(f"{engine}: skipped (missing {missing_dependencies})")
+                continue
+            n_failures += check_engine(engine, csv_paths)
+    sys.exit(1 if n_failures > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
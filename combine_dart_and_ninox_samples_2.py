@@ -15,6 +15,10 @@ Script functionality:
 - iterate through all the Report files to extract all available sample names, 
     write them to a new data sheet containing DArT order number, DArT file name and all sample files of that DArT file.
 - read in the ninox data file for all current samples.
+- optionally handle several sites (data roots) as parallel shards: python combine_dart_and_ninox_samples_2.py --sites sites.json
+- optionally keep running and handle new DArT orders and Ninox exports as they arrive: python combine_dart_and_ninox_samples_2.py watch
+- an interrupted run is resumed by the next run, use --fresh to start from scratch instead. Only one run at a time can use a data root (run.lock).
+- the CSV engine for the large reads can be selected with --csv-engine pandas|pyarrow|polars, see benchmarks/bench_csv_engines.py.
 
 The final combined file should contain the following columns, potentially more if needed along the way:
 "Project", "Council", "Sample.Name", "Sample.ID", "Latitude", "Longitude", "Survey.Type", "Extraction.Method", "Date.Sample", 
@@ -22,6 +26,7 @@ The final combined file should contain the following columns, potentially more i
 """
 
 import os
+import sys
 import pandas as pd
 import numpy as np
 import glob
@@ -30,6 +35,17 @@ import time
 import threading
 import json
 import logging
+import argparse
+import shutil
+import socket
+import datetime
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+# optional: inotify is used by the watch mode where available, otherwise the files are polled:
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
 
 """
 DArT folder structure - example:
@@ -43,15 +59,440 @@ DArT
 """
 
 
+################## HELPER FUNCTIONS & CLASSES ##################
+# CSV engine used for the large reads (Ninox exports, SampleFiles, DArT reports and the merged intermediates):
+# "pandas" (default C parser), "pyarrow" (multithreaded pyarrow CSV reader) or "polars" (lazy scanning, only the needed columns are read).
+# Set it with --csv-engine or the environment variable NINOX_DART_CSV_ENGINE, which is passed on to the shards of multi-site runs.
+# If the optional dependency of an engine is missing, or a read uses options the engine doesn't support, the pandas engine is used instead.
+# The other engines have to return the same dataframe (values and dtypes) as the pandas engine,
+# this is checked by benchmarks/check_csv_engines.py for every option on the allowlist below.
+csv_engines = ["pandas", "pyarrow", "polars"]
+csv_engine = os.environ.get("NINOX_DART_CSV_ENGINE", "pandas")
+csv_engine_dependencies = {"pandas": [], "pyarrow": ["pyarrow"], "polars": ["polars", "pyarrow"]}   # polars needs pyarrow to convert to pandas.
+# read_csv options which each engine can handle, all other options (e.g. parse_dates, dtype, keep_default_na) make the read fall back to the pandas engine:
+csv_engine_options = {"pyarrow": {"usecols", "header", "skiprows"},
+                      "polars": {"usecols", "header", "skiprows", "nrows"}}
+
+
+def set_csv_engine(engine):
+    """select the CSV engine for all following reads, falls back to "pandas" if a dependency of the engine is missing."""
+    global csv_engine
+    if engine not in csv_engines:
+        raise ValueError(f"unknown csv engine {engine}, available engines: {csv_engines}")
+    missing_dependencies = [module for module in csv_engine_dependencies[engine] if importlib.util.find_spec(module) is None]
+    if len(missing_dependencies) > 0:
+        print(f"csv engine {engine} is not available (missing {missing_dependencies}), the pandas engine is used.")
+        logging.warning(f"csv engine {engine} is not available (missing {missing_dependencies}), the pandas engine is used.")
+        engine = "pandas"
+    csv_engine = engine
+    os.environ["NINOX_DART_CSV_ENGINE"] = engine
+    logging.info(f"csv engine: {csv_engine}")
+    return csv_engine
+
+
+def match_pandas_dtypes(data):
+    """convert the differences of a dataframe read by pyarrow or polars to what the pandas parser returns:
+    columns without any value are float64, missing values in object columns are NaN (not None) and dates stay text.
+    Columns which were parsed as timestamps can't be converted back to the original text, in that case a ValueError is raised,
+    so the file is read with the pandas engine instead."""
+    for column in data.columns:
+        if pd.api.types.is_datetime64_any_dtype(data[column]):
+            raise ValueError(f"column {column} was parsed as timestamp, which the pandas parser doesn't do")
+        if data[column].dtype == object and len(data) > 0:
+            missing_values = data[column].isna()
+            if missing_values.all():
+                data[column] = np.nan
+                continue
+            if isinstance(data[column][~missing_values].iloc[0], datetime.date):
+                # pyarrow parses YYYY-MM-DD as date, which is written back the same way:
+                data[column] = data[column].map(lambda value: value.isoformat() if isinstance(value, datetime.date) else value)
+            if missing_values.any():
+                data[column] = data[column].where(~missing_values, np.nan)
+    return data
+
+
+def pandas_column_names(file_path, usecols=None, header="infer", skiprows=None):
+    """the column names the pandas parser gives the file (numbers without header, duplicated and empty names renamed)
+    and the names of the columns in usecols in the order of the file.
+    The other engines read the file without header and get these names, so the columns are named the same way."""
+    first_row = pd.read_csv(file_path, nrows=1, header=header, skiprows=skiprows)
+    if not isinstance(first_row.index, pd.RangeIndex):
+        raise ValueError("the rows have one more field than the header, which the pandas parser reads as index")
+    column_names = list(first_row.columns)
+    if usecols is None:
+        return column_names, column_names
+    if callable(usecols):
+        keep_columns = [column for column in column_names if usecols(column)]
+    elif any(column not in column_names for column in usecols):
+        raise ValueError("usecols contains columns which aren't in the file")
+    else:
+        keep_columns = [column for column in column_names if column in set(usecols)]
+    if len(keep_columns) == 0:
+        raise ValueError("usecols selects no columns")
+    return column_names, keep_columns
+
+
+def read_csv_pyarrow(file_path, usecols=None, header="infer", skiprows=None):
+    """read a csv with the multithreaded pyarrow CSV reader of pandas.
+    The header is read by pandas and the data without header, as the pyarrow engine ignores skiprows before a header row."""
+    column_names, keep_columns = pandas_column_names(file_path, usecols=usecols, header=header, skiprows=skiprows)
+    data_skiprows = (skiprows or 0) + (0 if header is None else 1)
+    # the columns are selected by position, the names of pandas are set again after the read:
+    data = pd.read_csv(file_path, engine="pyarrow", header=None, skiprows=data_skiprows,
+                       usecols=[column_names.index(column) for column in keep_columns] if usecols is not None else None)
+    if data.shape[1] != len(keep_columns):
+        raise ValueError("the rows have a different number of fields than the header")
+    data.columns = keep_columns
+    return match_pandas_dtypes(data)
+
+
+def read_csv_polars(file_path, usecols=None, header="infer", skiprows=None, nrows=None):
+    """read a csv with polars and return it as pandas dataframe. The file is scanned lazily, so only the columns in usecols are parsed.
+    The default NA strings of pandas are read as missing values and the columns are named like by the pandas parser.
+    Rows with more fields than the header raise an error, so the file is read with the pandas engine instead of losing data."""
+    import polars as pl
+    from pandas._libs.parsers import STR_NA_VALUES
+    column_names, keep_columns = pandas_column_names(file_path, usecols=usecols, header=header, skiprows=skiprows)
+    data_skiprows = (skiprows or 0) + (0 if header is None else 1)
+    # polars only takes text column names, the names of pandas are set again after the read:
+    polars_names = [f"column_{i}" for i in range(len(column_names))]
+    lazy_data = pl.scan_csv(file_path, has_header=False, skip_rows=data_skiprows, n_rows=nrows, new_columns=polars_names,
+                            null_values=sorted(STR_NA_VALUES), infer_schema_length=10000)
+    if lazy_data.collect_schema().names() != polars_names:
+        raise ValueError("the rows have more fields than the header")
+    lazy_data = lazy_data.select([polars_names[column_names.index(column)] for column in keep_columns])
+    data = lazy_data.collect().to_pandas()
+    data.columns = keep_columns
+    return match_pandas_dtypes(data)
+
+
+def read_csv_engine(file_path, engine=None, fallback=True, **kwargs):
+    """read a csv file with the configured CSV engine (or engine), all keyword arguments are pandas.read_csv options.
+    low_memory only applies to the pandas engine and is dropped for the others.
+    If the engine fails, the file is read with the pandas engine, unless fallback is False, then the error is raised."""
+    engine = engine if engine is not None else csv_engine
+    engine_kwargs = {option: value for option, value in kwargs.items() if option != "low_memory"}
+    if engine in csv_engine_options and set(engine_kwargs) <= csv_engine_options[engine]:
+        try:
+            if engine == "pyarrow":
+                return read_csv_pyarrow(file_path, **engine_kwargs)
+            return read_csv_polars(file_path, **engine_kwargs)
+        except Exception as error:
+            if not fallback:
+                raise
+            logging.warning(f"csv engine {engine} failed to read {file_path} ({error}), the pandas engine is used.")
+    elif not fallback and engine != "pandas":
+        raise ValueError(f"csv engine {engine} doesn't support the options {sorted(set(engine_kwargs) - csv_engine_options.get(engine, set()))}")
+    return pd.read_csv(file_path, **kwargs)
+
+
+def fsync_folder(folder):
+    """flush the directory entry of a renamed file to disk. Not possible on Windows, where os.replace is durable on its own."""
+    if os.name == "nt":
+        return
+    folder_fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(folder_fd)
+    finally:
+        os.close(folder_fd)
+    return
+
+
+def atomic_to_csv(data, file_path, **kwargs):
+    """write data to file_path without ever leaving a half-written file behind: the csv is written to a temporary file
+    in the same folder first and synced to disk, then it replaces file_path in one step and the folder is synced, 
+    so even after a power loss file_path holds either the old or the new data. If writing fails, the old file_path stays untouched."""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        # pandas writes utf-8 by default, the file is opened with it explicitly, as open() uses the encoding of the locale:
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            data.to_csv(f, **kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+        fsync_folder(os.path.dirname(os.path.abspath(file_path)))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return
+
+
+def atomic_write_json(content, file_path):
+    """write content as json to file_path using the same write-sync-rename approach as atomic_to_csv()."""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(content, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+        fsync_folder(os.path.dirname(os.path.abspath(file_path)))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return
+
+
+def file_state(file_path):
+    """returns size and modification time of file_path, or None if it doesn't exist."""
+    if not os.path.isfile(file_path):
+        return None
+    file_stat = os.stat(file_path)
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+
+def process_alive(pid):
+    """returns whether a process with pid is running on this host. On Windows os.kill would end the process, so it is assumed to be running."""
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists, but belongs to another user:
+        return True
+    return True
+
+
+class data_root_lock():
+    """class to make sure only one process at a time writes the outputs of a data root, e.g. the watch mode and a scheduled run.
+    The lock is the file run.lock in the data root, created exclusively and holding the pid and host of the process which holds it.
+    If the process holding the lock isn't running anymore (only checked on the same host), the lock is stale and is taken over.
+    Otherwise acquire() raises a RuntimeError, so the second process doesn't run at the same time."""
+    def __init__(self, data_root) -> None:
+        self.lock_file = os.path.join(data_root, "run.lock")
+        self.owner = {"pid": os.getpid(), "host": socket.gethostname()}
+        self.acquired = False
+        pass
+
+    def acquire(self):
+        if self.acquired:
+            return
+        while True:
+            try:
+                lock_fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(self.lock_file, encoding="utf-8") as f:
+                        holder = json.load(f)
+                except (FileNotFoundError, json.JSONDecodeError):
+                    # the lock was just released or is still being written by the other process:
+                    time.sleep(0.1)
+                    continue
+                if holder.get("host") == self.owner["host"] and not process_alive(holder.get("pid")):
+                    print(f"removing stale lock of process {holder.get('pid')}, which isn't running anymore.")
+                    logging.warning(f"removing stale lock {self.lock_file} of process {holder.get('pid')}, which isn't running anymore.")
+                    os.remove(self.lock_file)
+                    continue
+                raise RuntimeError(f"{self.lock_file} is held by process {holder.get('pid')} on host {holder.get('host')} since {holder.get('started')}, "
+                                   "another run is using this data root. If that run isn't running anymore, remove the lock file.")
+            with os.fdopen(lock_fd, "w", encoding="utf-8") as f:
+                json.dump({**self.owner, "started": datetime.datetime.now().isoformat(timespec="seconds")}, f)
+            self.acquired = True
+            logging.info(f"lock {self.lock_file} acquired by process {self.owner['pid']}.")
+            return
+
+    def release(self):
+        if not self.acquired:
+            return
+        if os.path.exists(self.lock_file):
+            os.remove(self.lock_file)
+        self.acquired = False
+        logging.info(f"lock {self.lock_file} released by process {self.owner['pid']}.")
+        return
+
+
+class run_journal():
+    """class to checkpoint the progress of a run in run_journal.json in the data root, so an interrupted run can be resumed.
+    The journal holds the finished stages (e.g. the merge of a ninox survey type) and the finished DArT orders, 
+    which are checkpointed to dart_merged/orders/<dart order number>.csv.
+    While a run is going on it holds the lock of the data root, so a second process can't resume (and clean up) a run which is still going.
+    If the journal of the last run is still "running" when a new run starts, that run was interrupted and is resumed:
+    finished stages are skipped and finished DArT orders are read from their checkpoints. 
+    With fresh=True the journal of an interrupted run is discarded, so a run which keeps failing isn't resumed forever.
+    Stages which append to an output file are marked pending with the state of that file before it is written. 
+    If the run was interrupted after the file was replaced but before the stage was marked finished, 
+    the changed file shows that the stage is finished, so its data isn't appended a second time.
+    Once the run is finished, the journal is marked "finished" and the DArT order checkpoints are removed, so the next run starts from scratch.
+    """
+    def __init__(self, data_root) -> None:
+        self.data_root = data_root
+        self.journal_file = os.path.join(data_root, "run_journal.json")
+        self.checkpoint_folder = os.path.join(data_root, "dart_merged", "orders")
+        self.lock = data_root_lock(data_root)
+        self.journal = {}
+        self.resumed = False
+        pass
+
+    def start(self, fresh=False):
+        """start a new run or resume the interrupted last run, unless fresh is True. Raises a RuntimeError if another process holds the lock."""
+        self.lock.acquire()
+        if os.path.isfile(self.journal_file):
+            with open(self.journal_file, encoding="utf-8") as f:
+                journal = json.load(f)
+            if journal.get("status") == "running" and fresh:
+                print(f"discarding the journal of the interrupted run started at {journal['started']}, starting from scratch.")
+                logging.info(f"discarding the journal of the interrupted run started at {journal['started']} (process {journal.get('pid')} on host {journal.get('host')}), starting from scratch.")
+            elif journal.get("status") == "running":
+                # the lock is held by this process, so the run of the journal isn't running anymore:
+                journal.update(self.lock.owner)
+                self.journal = journal
+                self.resumed = True
+                atomic_write_json(self.journal, self.journal_file)
+                print(f"resuming interrupted run started at {journal['started']}, finished stages: {list(journal['stages'])}")
+                logging.info(f"resuming interrupted run started at {journal['started']}, finished stages: {list(journal['stages'])}, finished DArT orders: {len(journal['dart_orders'])}")
+                return self.resumed
+        self.journal = {"status": "running", "started": datetime.datetime.now().isoformat(timespec="seconds"), **self.lock.owner, 
+                        "stages": {}, "pending": {}, "dart_orders": {}, "dart_order_stats": {}}
+        self.resumed = False
+        # remove the DArT order checkpoints of an earlier run:
+        shutil.rmtree(self.checkpoint_folder, ignore_errors=True)
+        atomic_write_json(self.journal, self.journal_file)
+        return self.resumed
+
+    def is_done(self, stage):
+        if stage in self.journal["stages"]:
+            return True
+        pending = self.journal.get("pending", {}).get(stage)
+        if pending is not None and file_state(pending["file"]) != pending["state"]:
+            # the output of the stage was already replaced by the interrupted run:
+            logging.info(f"run journal: output {pending['file']} of pending stage {stage} was already written, stage finished.")
+            self.stage_done(stage)
+            return True
+        return False
+
+    def stage_pending(self, stage, file_path):
+        """record the state of the output file_path of a stage before the stage writes it."""
+        self.journal.setdefault("pending", {})[stage] = {"file": file_path, "state": file_state(file_path)}
+        atomic_write_json(self.journal, self.journal_file)
+        return
+
+    def stage_done(self, stage):
+        """checkpoint a finished stage."""
+        self.journal["stages"][stage] = datetime.datetime.now().isoformat(timespec="seconds")
+        self.journal.get("pending", {}).pop(stage, None)
+        atomic_write_json(self.journal, self.journal_file)
+        logging.info(f"run journal: stage {stage} finished.")
+        return
+
+    def dart_order_checkpoint(self, dart_order_number):
+        """returns the checkpoint file of a finished DArT order, or None if the order hasn't been finished yet."""
+        checkpoint_file = self.journal["dart_orders"].get(dart_order_number)
+        if checkpoint_file is not None and os.path.isfile(checkpoint_file) and dart_order_number in self.journal.get("dart_order_stats", {}):
+            return checkpoint_file
+        return None
+
+    def dart_order_stats(self, dart_order_number):
+        """returns the summary statistics checkpointed with a finished DArT order."""
+        return self.journal["dart_order_stats"][dart_order_number]
+
+    def save_dart_order(self, dart_order_number, dart_data, dart_order_stats):
+        """checkpoint the data and the summary statistics of a finished DArT order."""
+        os.makedirs(self.checkpoint_folder, exist_ok=True)
+        checkpoint_file = os.path.join(self.checkpoint_folder, f"{dart_order_number}.csv")
+        atomic_to_csv(dart_data, checkpoint_file, index=False)
+        self.journal["dart_orders"][dart_order_number] = checkpoint_file
+        self.journal.setdefault("dart_order_stats", {})[dart_order_number] = dart_order_stats
+        atomic_write_json(self.journal, self.journal_file)
+        return
+
+    def finish(self):
+        """mark the run as finished, remove the DArT order checkpoints and release the lock."""
+        self.journal["status"] = "finished"
+        self.journal["finished"] = datetime.datetime.now().isoformat(timespec="seconds")
+        self.journal["dart_orders"] = {}
+        self.journal["dart_order_stats"] = {}
+        atomic_write_json(self.journal, self.journal_file)
+        shutil.rmtree(self.checkpoint_folder, ignore_errors=True)
+        self.lock.release()
+        logging.info("run journal: run finished.")
+        return
+
+    def stop(self):
+        """release the lock of a run which failed, its journal stays "running", so the next run resumes it."""
+        self.lock.release()
+        return
+
+
 ################## MAIN FUNCTIONS & CLASSES ##################
-ninox_filedict = {"Dog": {"Genetics": "4 - Genetics.csv", "Extractions": "5 - Extractions.csv"}, 
-                                "Drone": {"Genetics": "6 - Drone Genetics.csv", "Extractions": "7 - Drone Extractions.csv"}, 
-                                "Opportunistic": {"Genetics":"9 - Opportunistic Genetics.csv", "Extractions": "9b - Opportunistic Extractions.csv"}, 
-                                "Tracking": {"Genetics": "2 - TK Genetics.csv", "Extractions": "3 - TK Extractions.csv"}, 
-                                "Partner": {"Genetics": "Partners Genetic data.csv", "Extractions": "Partner Extraction.csv"}}
+# the survey types, their Ninox export files, column aliases, date formats and extra columns are defined in ninox_schema.json.
+# New survey types can be added there without changing this script.
+ninox_schema_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ninox_schema.json")
+
+class ninox_schema_registry():
+    """class to hold the declarative schema of all Ninox survey types, loaded from ninox_schema.json.
+    For each survey type the schema defines the Genetics and Extractions export files, the column aliases used in each file,
+    the date format of the date column and any extra columns which are only relevant for that survey type.
+    The schema is compiled once into a plan per survey type and source file: 
+    the projection holds all raw column names which are needed, the rename dict maps them to the harmonized column names.
+    The readers apply both while reading the file, so unneeded columns are never loaded.
+    """
+    def __init__(self, schema_file=ninox_schema_file) -> None:
+        with open(schema_file) as f:
+            schema = json.load(f)
+        self.schema_file = schema_file
+        self.needed_columns = schema["needed_columns"]
+        self.ninox_filedict = {}
+        self.extra_columns = {}
+        self.plans = {}
+        for survey_type, survey_schema in schema["survey_types"].items():
+            self.ninox_filedict[survey_type] = survey_schema["files"]
+            self.extra_columns[survey_type] = survey_schema.get("extra_columns", [])
+            for source, source_schema in schema["sources"].items():
+                self.plans[(survey_type, source)] = self.compile_plan(survey_type, source, source_schema, survey_schema)
+        # print the compiled survey types to log file:
+        logging.info(f"ninox schema loaded from {schema_file}, survey types: {list(self.ninox_filedict)}")
+        pass
+
+    def compile_plan(self, survey_type, source, source_schema, survey_schema):
+        """compile the projection and rename plan for one source file ("Genetics" or "Extractions") of a survey type.
+        Survey type specific aliases and date formats take precedence over the defaults of the source."""
+        aliases = dict(source_schema.get("aliases", {}))
+        aliases.update(survey_schema.get("aliases", {}).get(source, {}))
+        target_columns = frozenset(self.needed_columns) | frozenset(self.extra_columns[survey_type])
+        # only keep aliases which map to a needed or extra column:
+        rename = {raw_column: column for raw_column, column in aliases.items() if column in target_columns}
+        plan = {"file": survey_schema["files"][source], 
+                "projection": frozenset(rename) | target_columns,
+                "rename": rename,
+                "aliases": aliases,
+                "target_columns": target_columns,
+                "date_column": source_schema["date_column"],
+                "date_format": survey_schema.get("date_formats", {}).get(source, source_schema["date_format"])}
+        return plan
+
+    def get_plan(self, survey_type, source):
+        return self.plans[(survey_type, source)]
+
+    def read_header(self, survey_type, source, ninox_folder):
+        """read only the header of the Genetics or Extractions file of a survey type, 
+        returns a dict of the stripped raw column names and their names after applying the aliases."""
+        plan = self.get_plan(survey_type, source)
+        raw_columns = [column.strip() for column in pd.read_csv(os.path.join(ninox_folder, plan["file"]), nrows=0).columns]
+        return {column: plan["aliases"].get(column, column) for column in raw_columns}
+
+    def read_ninox_source(self, survey_type, source, ninox_folder):
+        """read in the Genetics or Extractions file of a survey type and apply its compiled plan in one step:
+        only the projected columns are read and they are renamed to the harmonized column names.
+        Columns which are in both the Genetics and the Extractions file are read as well, 
+        they are kept as <column>_g and <column>_e after merging, like in files merged before the schema was introduced.
+        Leading and trailing whitespaces are removed from the column names before matching."""
+        plan = self.get_plan(survey_type, source)
+        other_source = "Extractions" if source == "Genetics" else "Genetics"
+        header = self.read_header(survey_type, source, ninox_folder)
+        other_columns = frozenset(self.read_header(survey_type, other_source, ninox_folder).values())
+        shared_columns = frozenset(raw_column for raw_column, column in header.items() if column in other_columns and column != "Sample.Name")
+        projection = plan["projection"] | shared_columns
+        ninox_source = read_csv_engine(os.path.join(ninox_folder, plan["file"]), usecols=lambda column: column.strip() in projection)
+        ninox_source.columns = [plan["aliases"].get(column.strip(), column.strip()) for column in ninox_source.columns]
+        return ninox_source
+
 
 class ninox_all():
-    def __init__(self, ninox_filedict) -> None:
+    def __init__(self, ninox_filedict, data_root=None) -> None:
+        # data_root is the folder holding the ninox, DArT and output folders of one site, by default the current working directory:
+        self.data_root = data_root if data_root is not None else os.getcwd()
         self.ninox_data_status = False
         self.ninox_merged_currency = np.nan    
         self.ninox_data = pd.DataFrame()
@@ -60,7 +501,7 @@ class ninox_all():
 
     def determine_data_status(self):
         # test if the ninox merged data file exists, if it does set data status to True:
-        if os.path.isfile(os.getcwd() + f"/ninox_merged/ninox_merged.csv"):
+        if os.path.isfile(self.data_root + f"/ninox_merged/ninox_merged.csv"):
             self.ninox_data_status = True
         else:
             self.ninox_data_status = False
@@ -72,7 +513,7 @@ class ninox_all():
         new data needs to be downloaded."""
         if self.ninox_data_status == True:
             # read in the merged ninox data:
-            self.ninox_data = pd.read_csv(os.getcwd() + f"/ninox_merged/ninox_merged.csv")
+            self.ninox_data = read_csv_engine(self.data_root + f"/ninox_merged/ninox_merged.csv")
             # convert the Survey.Date column to datetime format, date format in Ninox data: DD/MM/YYYY:
             self.ninox_data["Survey.Date"] = pd.to_datetime(self.ninox_data["Survey.Date"], dayfirst=True).dt.date
             # find newest sample date in self.ninox_data
@@ -90,7 +531,7 @@ class ninox_all():
         only the samples with Sample.Date newer than ninox_merged_currency are added from each survey type.
         The data status is determined by the existence of the ninox_merged file.
         """
-        file_path = os.path.join(os.getcwd(), "ninox_merged", f"ninox_merged.csv")
+        file_path = os.path.join(self.data_root, "ninox_merged", f"ninox_merged.csv")
 
         # load all ninox_merged_survey_type.csv files into a list of dataframes:
         ninox_merged_list = []
@@ -101,7 +542,7 @@ class ninox_all():
                 # print survey type to console:
                 print(f"survey type: {survey_type}")
                 # read in the ninox_merged_survey_type.csv file, parse the date Survey.Date as DD/MM/YYYY format:
-                ninox_merged_survey_type = pd.read_csv(os.getcwd() + f"/ninox_merged/ninox_merged_{survey_type}.csv", parse_dates=["Survey.Date"])
+                ninox_merged_survey_type = read_csv_engine(self.data_root + f"/ninox_merged/ninox_merged_{survey_type}.csv", parse_dates=["Survey.Date"])
                 # convert the Survey.Date column from datetime to date format, date format in Ninox data: DD/MM/YYYY:
                 ninox_merged_survey_type["Survey.Date"] = ninox_merged_survey_type["Survey.Date"].dt.date
                 # extract all samples newer than currency:
@@ -113,7 +554,7 @@ class ninox_all():
             # read in and keep the entire ninox_merged_survey_type.csv file:
             for survey_type in self.ninox_filedict:
                 # read in the ninox_merged_survey_type.csv file:
-                ninox_merged_survey_type = pd.read_csv(os.getcwd() + f"/ninox_merged/ninox_merged_{survey_type}.csv")
+                ninox_merged_survey_type = read_csv_engine(self.data_root + f"/ninox_merged/ninox_merged_{survey_type}.csv")
                 # append ninox_merged_survey_type to ninox_merged_list:
                 ninox_merged_list.append(ninox_merged_survey_type)
 
@@ -125,17 +566,17 @@ class ninox_all():
         # if the data status is true, append the new data to the existing ninox_merged.csv file:
         if self.ninox_data_status == True:
             # read in the existing ninox_merged.csv file:
-            ninox_merged = pd.read_csv(os.getcwd() + f"/ninox_merged/ninox_merged.csv")
+            ninox_merged = read_csv_engine(self.data_root + f"/ninox_merged/ninox_merged.csv")
             # append self.ninox_data to ninox_merged:
             ninox_merged = pd.concat([ninox_merged, self.ninox_data], ignore_index=True)
             # save ninox_merged to file_path:
-            ninox_merged.to_csv(file_path, index=False)
+            atomic_to_csv(ninox_merged, file_path, index=False)
             # print number of new samples added per survey type and shape of new ninox_merged to log file:
             logging.info(f"number of new samples added: {self.ninox_data.shape[0]}, shape of new ninox_merged: {ninox_merged.shape}")
             overwrite = "appended"
 
         else:
-            self.ninox_data.to_csv(file_path, index=False)
+            atomic_to_csv(self.ninox_data, file_path, index=False)
             # print file was saved:
             print("ninox_merged.csv was saved.")
             overwrite = "initial file created"
@@ -156,8 +597,10 @@ class ninox_survey():
     and finally the Partner Genetics, with only Partner Extractions as a subtab.
     The modules in this class are there to read in the Genetics and the Extractions data respectively and finally combine the two for each survey type.    
     """
-    def __init__(self, ninox_filedict, survey_type=np.nan, ninox_all_currency=np.nan) -> None:
+    def __init__(self, schema_registry, survey_type=np.nan, ninox_all_currency=np.nan, data_root=None) -> None:
         """
+        schema_registry is the ninox_schema_registry holding the compiled column plans for all survey types.
+        data_root is the folder holding the ninox and ninox_merged folders of one site, by default the current working directory.
         self.ninox_currency holds the newest sample date from the merged ninox file, if that's already available, otherwise it's np.nan by default.
         A dataframe is created to hold data from the ninox files using the needed columns.
         self.skipped_columns holds all columns which are not in the Genetics file and remain to be read in from Extractions file.
@@ -166,14 +609,16 @@ class ninox_survey():
         self.currency = ninox_all_currency
         self.genetics_currency = np.nan
         self.extractions_currency = np.nan
-        self.needed_columns = ["Project", "Sample.Name", "Genetic.ID", "Latitude", "Longitude", "Survey.Type", "Survey.Date", "Date.Extraction", "Extraction.Method", "Dart.Sample.ID", "Dart.Order.Number", "Extraction.ID"]   
-        self.extra_columns = ["Council", "Scat.ID"] # columns which are only relevant for Dog Surveys. Set NaN for all other survey_types.
+        self.data_root = data_root if data_root is not None else os.getcwd()
+        self.schema_registry = schema_registry
+        self.needed_columns = schema_registry.needed_columns
+        self.extra_columns = schema_registry.extra_columns[survey_type] # columns which are only relevant for some survey types, e.g. Council and Scat.ID for Dog Surveys.
         self.ninox_genetics = pd.DataFrame()
         self.ninox_extractions = pd.DataFrame()
         self.ninox_remerge_survey = False
         self.remaining_columns = []
         self.skipped_samples = []
-        self.ninox_filedict = ninox_filedict
+        self.ninox_filedict = schema_registry.ninox_filedict
         self.survey_type = survey_type
         print(f"handling survey type {self.survey_type} of ninox data ...")
         # print to log file that now the ninox data will be handled:
@@ -181,63 +626,40 @@ class ninox_survey():
         pass
        
     def read_Genetics(self):
-        # TODO: define this in subclass for each Survey Type because field names are called differently!!!!
-        # refer to GPS_Harmonizer as reference.
         """This function reads in the "Genetics.csv" file from the ninox folder of the respective survey type and returns a pandas dataframe
-        with all columns from all needed apparent in this file. To do so all column names are read in and compared to the
-        needed column names. If a column name is found, the column is added to the pandas dataframe self.ninox_data.
-        If not, the column is skipped.
+        with all columns from all needed apparent in this file. The field names differ between survey types, 
+        so the compiled plan of the schema registry is used to read only the needed (and extra) columns and rename them to the needed column names.
+        Needed columns which are not apparent in this file are remembered in self.remaining_columns.
         """
-        genetics_file = self.ninox_filedict[self.survey_type]["Genetics"]
+        genetics_plan = self.schema_registry.get_plan(self.survey_type, "Genetics")
+        genetics_file = genetics_plan["file"]
+        date_column = genetics_plan["date_column"]
         # print to console that genetics file is being read and handled:
         print(f"\nreading in Genetics file {genetics_file} ...")
 
-        ninox_genetics = pd.read_csv(os.getcwd() + f"/ninox/{genetics_file}")
-        # rename columns in ninox_genetics to match needed_columns:
-        ninox_genetics.rename(columns={"Projects":"Project", "Sample Name": "Sample.Name", "Genetic Latitude Pin": "Latitude", "Genetic Longitude Pin": "Longitude",
-                                    "Genetics Survey Type": "Survey.Type", "Survey Date": "Survey.Date", "Genetic ID":"Genetic.ID"}, inplace=True)
-        
-        if self.survey_type == "Dog":
-            ninox_genetics.rename(columns={"Scat ID":"Scat.ID"}, inplace=True)
+        # read in only the needed columns, already renamed to match needed_columns:
+        ninox_genetics = self.schema_registry.read_ninox_source(self.survey_type, "Genetics", self.data_root + "/ninox")
         
         # extract the newest sample date from the ninox_genetics file:
-        self.genetics_currency = ninox_genetics["Survey.Date"].dropna().max()
-
-        # extract column names from ninox_genetics
-        ninox_genetics_columns = ninox_genetics.columns
-        #print("ninox_genetics_columns: ", ninox_genetics_columns)
-
-        # iterate through ninox_genetics_columns and compare to needed_columns
-        appended_columns = []
-        for column in ninox_genetics_columns:
-            if self.survey_type == "Dog":   
-                # append extra columsn to needed columns
-                if column in self.needed_columns or column in self.extra_columns:
-                    appended_columns.append(column)
-                else:
-                    pass
-            else: # all other survey types 
-                if column in self.needed_columns:
-                    appended_columns.append(column)
-                else:
-                    pass
+        self.genetics_currency = ninox_genetics[date_column].dropna().max()
+
+        # all columns read in are needed or extra columns, as the plan projected the file onto them:
+        appended_columns = frozenset(ninox_genetics.columns)
         
         ninox_genetics["Survey.Type"] = self.survey_type
 
-        # add columns that are in needed_columns but not in appended_columns to self.remaining_columns
-        self.remaining_columns = [column for column in self.needed_columns if column not in appended_columns]
-        # Remove "Survey.Type" from self.remaining_columns:
-        self.remaining_columns.remove("Survey.Type")
+        # add columns that are in needed_columns but not in appended_columns to self.remaining_columns, except "Survey.Type":
+        self.remaining_columns = [column for column in self.needed_columns if column not in appended_columns and column != "Survey.Type"]
 
-        ninox_genetics["Survey.Date.Copy"] = ninox_genetics["Survey.Date"]
-        ninox_genetics["Survey.Date"] = pd.to_datetime(ninox_genetics["Survey.Date"], format="%d/%m/%Y", errors='coerce').dt.date
+        ninox_genetics["Survey.Date.Copy"] = ninox_genetics[date_column]
+        ninox_genetics[date_column] = pd.to_datetime(ninox_genetics[date_column], format=genetics_plan["date_format"], errors='coerce').dt.date
 
         ### see if ninox data for this survey type has already been merged before, if so only extarct data newer than self.currency:
         ### if currency is not nan extract all samples newer than currency and append them to self.ninox_data_survey_type file.
         ### if newer data has been added, set ninox_remerge_survey to true, to remerge all ninox data for all surveys and overwrite the ninox_merged.csv file.
         if self.currency is not np.nan:
             # test for samples in genetics file newer than currency:
-            self.genetics_currency = ninox_genetics["Survey.Date"].dropna().max()
+            self.genetics_currency = ninox_genetics[date_column].dropna().max()
 
             # write newest sample date to log file:
             logging.info(f"newest sample date in {genetics_file}: {self.genetics_currency}")
@@ -245,7 +667,7 @@ class ninox_survey():
             if self.genetics_currency > self.currency:
                 print("new samples found in ", genetics_file)
                 # extract all samples newer than currency:
-                self.ninox_genetics = ninox_genetics[ninox_genetics["Survey.Date"] > self.currency]
+                self.ninox_genetics = ninox_genetics[ninox_genetics[date_column] > self.currency]
                 # print shape of ninox_genetics_newer to log file:
                 logging.info(f"shape of new samples df: {self.ninox_genetics.shape}")
 
@@ -265,22 +687,16 @@ class ninox_survey():
         """This function reads in the "Extractions.csv" file and reads in the remaining columns needed which are stored
         in self.skipped_columns. The format of the Date extracted column is DD/MM/YYYY.
         In case of multiple extractions of a single sample there are duplicates of Sample.Name. """
-        extractions_file = self.ninox_filedict[self.survey_type]["Extractions"]
+        extractions_plan = self.schema_registry.get_plan(self.survey_type, "Extractions")
+        extractions_file = extractions_plan["file"]
+        date_column = extractions_plan["date_column"]
         # print to console that extractions file is being read and handled:
         print(f"\nreading in Extractions file {extractions_file} ...")
 
-        ninox_extractions = pd.read_csv(os.getcwd() + f"/ninox/{extractions_file}")
-        ninox_extractions.columns = [col.strip() for col in ninox_extractions.columns] # remove leading and trailing whitespaces from column names.
+        # read in only the needed columns, whitespaces are stripped from the column names and they are renamed to match needed_columns:
+        ninox_extractions = self.schema_registry.read_ninox_source(self.survey_type, "Extractions", self.data_root + "/ninox")
         # print("self.skipped_columns: ", self.remaining_columns)   # remaining columns to be added from Extractions to ninox_data.
 
-        # rename columns in ninox_extractions to match needed_columns:
-        ninox_extractions.rename(columns={"Sample Name":"Sample.Name", "Protocol":"Extraction.Method", "Date extracted": "Date.Extraction", 
-                                          "DART Sample ID (Sample name returned by DArT)": "Dart.Sample.ID", "Extraction ID":"Extraction.ID", "Genetic ID":"Genetic.ID", 
-                                          "DART Order Number":"Dart.Order.Number"}, inplace=True)
-        
-        # print column names for ninox_extractions:
-        # print("ninox_extractions columns: ", ninox_extractions.columns)
-
         # add "Sample.Name" to self.remaining_columns:
         self.remaining_columns.append("Sample.Name")
 
@@ -288,11 +704,11 @@ class ninox_survey():
         # Convert the "Date.Extraction" column to datetime. In the extraction file the date format seems to be MM/DD/YYYY:
         ### APPARENTLY CURRENTLY NINOX DATE FORMAT IS DETERMINED BY BROWSER SETTINGS....
 
-        # Convert the "Date.Extraction" column to datetime
-        ninox_extractions["Date.Extraction"] = pd.to_datetime(ninox_extractions["Date.Extraction"], format="%m/%d/%Y", errors='coerce').dt.date
+        # Convert the "Date.Extraction" column to datetime, the format is defined in the schema:
+        ninox_extractions[date_column] = pd.to_datetime(ninox_extractions[date_column], format=extractions_plan["date_format"], errors='coerce').dt.date
 
         # extract the newest sample date from the ninox_extractions file:
-        self.extractions_currency = ninox_extractions["Date.Extraction"].dropna().max()
+        self.extractions_currency = ninox_extractions[date_column].dropna().max()
 
         # write newest sample date to log file:
         logging.info(f"newest sample date in {extractions_file}: {self.extractions_currency}")
@@ -304,7 +720,7 @@ class ninox_survey():
         if pd.notnull(self.currency) and pd.notnull(self.extractions_currency): 
             if self.extractions_currency > self.currency:
                 # extract all samples newer than currency:
-                self.ninox_extractions = ninox_extractions[ninox_extractions["Date.Extraction"] > self.currency]
+                self.ninox_extractions = ninox_extractions[ninox_extractions[date_column] > self.currency]
                 # append shape to log.
                 logging.info(f"shape of new samples df: {self.ninox_extractions.shape}")
                 self.ninox_remerge_survey = True
@@ -342,11 +758,11 @@ class ninox_survey():
 
         ##### Merge ninox data for each survey type individually:
         # Create directory if it doesn't exist
-        os.makedirs("ninox_merged", exist_ok=True)
+        os.makedirs(os.path.join(self.data_root, "ninox_merged"), exist_ok=True)
 
         # File path: check if ninox merged for survey type exists, if it does check if self.ninox_remerge_survey is True, 
         # if it is overwrite the file, if not exit and note so in log.:
-        file_path = os.path.join(os.getcwd(), "ninox_merged", f"ninox_merged_{self.survey_type}.csv")
+        file_path = os.path.join(self.data_root, "ninox_merged", f"ninox_merged_{self.survey_type}.csv")
 
         # use pandas merge or join function to add data for the remaining columns from Extractions to ninox_genetics_data using the Sample.Name as index
         # first convert the dataframe columns "Sample.Name" to upper case:
@@ -363,7 +779,8 @@ class ninox_survey():
         ###########################################
         ### CLEAN UP DATA:
         # drop all columns in ninox_data which are not in self.needed_columns:
-        keep_columns = [column for column in ninox_data.columns if column in self.needed_columns]
+        needed_columns = frozenset(self.needed_columns)
+        keep_columns = [column for column in ninox_data.columns if column in needed_columns]
         # append all column names with '_g' and '_e' to keep_columns:
         keep_columns.extend([column for column in ninox_data.columns if column.endswith("_g") or column.endswith("_e")])
         # drop columns which contain no data unless they are in keep_columns:
@@ -394,7 +811,7 @@ class ninox_survey():
         if os.path.isfile(file_path) and self.currency is not np.nan:
             print(f"ninox_merged_{self.survey_type}.csv already exists, new samples will be appended to {file_path}.")
             # read in the ninox_merged_survey_type.csv file:
-            ninox_merged_survey_type = pd.read_csv(file_path)
+            ninox_merged_survey_type = read_csv_engine(file_path)
             # add all samples newer than currency (self.ninox_data) to ninox_merged_survey_type:
             ninox_merged_survey_type = pd.concat([ninox_merged_survey_type, ninox_data], ignore_index=True)
             # count all duplicates from ninox_merged_survey_type:
@@ -402,13 +819,13 @@ class ninox_survey():
             # write number of duplicates after appending new samples to log file:
             logging.info(f"number of duplicates after appending new samples: {ninox_merged_survey_type.duplicated().sum()}")
             # save ninox_merged_survey_type to file_path:
-            ninox_merged_survey_type.to_csv(file_path, index=False)
+            atomic_to_csv(ninox_merged_survey_type, file_path, index=False)
 
         else:
             # ninox_merged_survey_type.csv doesn't exist yet, it will be created.
             print(f"ninox_merged_{self.survey_type}.csv does not exist yet, it will be created.") 
             # SAVE self.ninox_data to file_path:
-            ninox_data.to_csv(file_path, index=False)
+            atomic_to_csv(ninox_data, file_path, index=False)
             # write to log file that ninox_merged_survey_type.csv will be created:
             logging.info(f"ninox_merged_{self.survey_type}.csv does not exist yet, it will be created.")
 
@@ -428,9 +845,14 @@ class dart():
     For older orders that file is called "DArT_extract*.csv, it contains the same column names.
     Orders from DKo18-3951 onwards contain this file, all older orders do not have any of these two files.
     """
-    def __init__(self) -> None:
+    def __init__(self, data_root=None) -> None:
+        # data_root is the folder holding the DArT and dart_merged folders of one site, by default the current working directory:
+        self.data_root = data_root if data_root is not None else os.getcwd()
         self.dart_file_dict = {}
         self.l_all_dart_samples = []
+        self.report_headers = {}    # header positions of all validated Report files, filled by validate_dart_orders().
+        self.quarantined_orders = []    # structured reasons for all DArT orders which failed validation.
+        self.dart_order_stats = {}  # summary statistics of each DArT order, computed by read_dart_order() while the order is read in.
         print("\nDArT data ...")
         # print to log file that now the DArT data will be handled:
         logging.info(f"now the DArT data will be handled.")
@@ -441,8 +863,11 @@ class dart():
         create a dict which will contain the filenames for the individual DArT orders. 
         If there are multiple files matching the naming convention of the Report File all of them will be added, later the one with the shortest filename will be used.
         If the Sample File is not available, add NA instead.
-        If no SampleFile but a DArT_extract file is available, add that instead."""
-        dart_folder_list = glob.glob(os.getcwd() + "/DArT/" + "DKo[0-9]*", recursive=True)
+        If no SampleFile but a DArT_extract file is available, add that instead.
+        The dict is rebuilt from scratch, DArT orders whose folder was removed are also dropped from the header positions, 
+        the summary statistics and the quarantined orders."""
+        self.dart_file_dict = {}
+        dart_folder_list = glob.glob(self.data_root + "/DArT/" + "DKo[0-9]*", recursive=True)
         # iterate through dart_folder_list and create pandas dataframe.
         dart_datafiles = pd.DataFrame(columns=["dart_folder", "report_files", "sample_file"])
         for folder in dart_folder_list:
@@ -483,6 +908,13 @@ class dart():
             dart_order_number = row["dart_folder"]
             # create a new entry in the dart_file_dict with the dart order number as key and the filenames as value:
             self.dart_file_dict[dart_order_number] = {"report_files": row["report_files"], "sample_file": row["sample_file"]}
+
+        # drop all DArT orders whose folder was removed:
+        for dart_order_number in [dart_order_number for dart_order_number in self.report_headers if dart_order_number not in self.dart_file_dict]:
+            del self.report_headers[dart_order_number]
+        for dart_order_number in [dart_order_number for dart_order_number in self.dart_order_stats if dart_order_number not in self.dart_file_dict]:
+            del self.dart_order_stats[dart_order_number]
+        self.quarantined_orders = [reason for reason in self.quarantined_orders if reason["dart_order_number"] in self.dart_file_dict]
         print("self.dart_file_dict: \n", json.dumps(self.dart_file_dict, indent=4))
 
         # add the dart_file_dict to the log file, print this nicely.
@@ -490,9 +922,121 @@ class dart():
 
         return
     
-    def check_all_dart_data_csv(self):
-        # Check if all_dart_data.csv is available
-        if os.path.exists('all_dart_data.csv'):
+    def validate_dart_order(self, dart_order_number):
+        """pre-flight check of a single DArT order, only the headers of the files are read.
+        The Report file needs the row starting with "AlleleID" (or "MarkerName" from DKo22-7008 onwards) within the first 10 rows,
+        this row needs the "RepAvg" (or "RatioAvgCountRefAvgCountSnp") column followed by at least one sample name.
+        The SampleFile/DArT_extract file, if available, needs the columns "Genotype" and "Tissue".
+        Returns the quarantine reason as dict, or None if the order is valid. The header positions of valid Report files are kept
+        in self.report_headers, so the Report files don't have to be searched again when the data is read in."""
+        order_folder = os.path.join(self.data_root, "DArT", dart_order_number)
+        report_filenames = self.dart_file_dict[dart_order_number]["report_files"]
+        if report_filenames == "no Report file available":
+            # nothing to validate, orders without Report file are skipped when the data is read in:
+            return None
+        # select the report file with the shorter filename if there are more than 1:
+        report_filename = min(report_filenames, key=len)
+
+        def quarantine_reason(filename, check, reason):
+            return {"dart_order_number": dart_order_number, "file": filename, "check": check, "reason": reason}
+
+        # CHECK THE REPORT FILE HEADER:
+        try:
+            report_head = pd.read_csv(os.path.join(order_folder, report_filename), nrows=10, header=None, low_memory=False)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError, OSError) as error:
+            return quarantine_reason(report_filename, "unreadable_report", str(error))
+        marker_rows = report_head.index[report_head.iloc[:, 0].isin(["AlleleID", "MarkerName"])]
+        if len(marker_rows) == 0:
+            return quarantine_reason(report_filename, "missing_marker_header", "no AlleleID or MarkerName row within the first 10 rows")
+        row_number = marker_rows[0]
+        header_row = report_head.iloc[row_number]
+        repavg_columns = header_row.index[header_row.isin(["RepAvg", "RatioAvgCountRefAvgCountSnp"])]
+        if len(repavg_columns) == 0:
+            return quarantine_reason(report_filename, "missing_repavg_column", f"no RepAvg or RatioAvgCountRefAvgCountSnp column in row {row_number}")
+        repavg_column = repavg_columns[0]
+        if header_row.iloc[repavg_column+1:].dropna().empty:
+            return quarantine_reason(report_filename, "no_sample_columns", f"no sample names after column {repavg_column}")
+
+        # CHECK THE SAMPLE FILE/DArT_extract FILE HEADER:
+        sample_filename = self.dart_file_dict[dart_order_number]["sample_file"]
+        if not sample_filename == "no SampleFile available":
+            try:
+                sample_file_columns = pd.read_csv(os.path.join(order_folder, sample_filename), nrows=0).columns
+            except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError, OSError) as error:
+                return quarantine_reason(sample_filename, "unreadable_samplefile", str(error))
+            missing_columns = [column for column in ["Genotype", "Tissue"] if column not in sample_file_columns]
+            if len(missing_columns) > 0:
+                return quarantine_reason(sample_filename, "samplefile_missing_columns", f"missing columns: {missing_columns}")
+
+        self.report_headers[dart_order_number] = {"report_filename": report_filename, "row_number": int(row_number), "repavg_column": int(repavg_column)}
+        return None
+
+    def validate_dart_orders(self, workers=8, dart_orders=None):
+        """validate the headers of all DArT orders in self.dart_file_dict in parallel, before the heavy stages run.
+        If dart_orders is given, only these orders are validated again and the earlier results are kept for all other orders.
+        Orders which fail validation are quarantined: they are removed from self.dart_file_dict, so the rest of the pipeline continues without them,
+        and their reasons are written to dart_merged/quarantined_dart_orders.csv and the log file."""
+        if dart_orders is None:
+            validate_orders = list(self.dart_file_dict)
+            self.quarantined_orders = []
+        else:
+            validate_orders = [dart_order_number for dart_order_number in dart_orders if dart_order_number in self.dart_file_dict]
+            # keep the earlier results of all orders which are not validated again and still exist:
+            self.quarantined_orders = [reason for reason in self.quarantined_orders 
+                                       if reason["dart_order_number"] not in validate_orders and reason["dart_order_number"] in self.dart_file_dict]
+        for dart_order_number in validate_orders:
+            self.report_headers.pop(dart_order_number, None)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            quarantine_reasons = list(executor.map(self.validate_dart_order, validate_orders))
+        new_quarantined_orders = [reason for reason in quarantine_reasons if reason is not None]
+        self.quarantined_orders.extend(new_quarantined_orders)
+
+        for reason in new_quarantined_orders:
+            print(f"----- DArT order {reason['dart_order_number']} quarantined: {reason['check']} in {reason['file']} ({reason['reason']})")
+            logging.warning(f"DArT order {reason['dart_order_number']} quarantined: {json.dumps(reason)}")
+        for reason in self.quarantined_orders:
+            # remove the quarantined order from the dart_file_dict:
+            self.dart_file_dict.pop(reason["dart_order_number"], None)
+
+        self.save_quarantined_orders()
+        print(f"validated {len(quarantine_reasons)} DArT orders, {len(self.quarantined_orders)} quarantined.")
+        logging.info(f"validated {len(quarantine_reasons)} DArT orders, {len(self.quarantined_orders)} quarantined.")
+        return self.quarantined_orders
+
+    def save_quarantined_orders(self):
+        """save the quarantined orders to dart_merged/quarantined_dart_orders.csv, an empty file means all orders passed."""
+        os.makedirs(os.path.join(self.data_root, "dart_merged"), exist_ok=True)
+        quarantined_orders = pd.DataFrame(self.quarantined_orders, columns=["dart_order_number", "file", "check", "reason"])
+        atomic_to_csv(quarantined_orders, os.path.join(self.data_root, "dart_merged", "quarantined_dart_orders.csv"), index=False)
+        return
+
+    def ingest_dart_order(self, dart_order_number):
+        """read in a single DArT order with read_dart_order(). The header checks of validate_dart_orders() can't catch everything
+        (e.g. broken rows further down in the file), so if reading the order fails for any reason, the order is quarantined 
+        with the check "ingest_failed" and None is returned, so the rest of the pipeline continues without it."""
+        try:
+            return self.read_dart_order(dart_order_number)
+        except Exception as error:
+            reason = {"dart_order_number": dart_order_number, "file": self.report_headers.get(dart_order_number, {}).get("report_filename", ""),
+                      "check": "ingest_failed", "reason": f"{type(error).__name__}: {error}"}
+            print(f"----- DArT order {dart_order_number} quarantined: {reason['check']} ({reason['reason']})")
+            logging.exception(f"DArT order {dart_order_number} quarantined: {json.dumps(reason)}")
+            self.quarantined_orders.append(reason)
+            self.dart_file_dict.pop(dart_order_number, None)
+            self.report_headers.pop(dart_order_number, None)
+            self.dart_order_stats.pop(dart_order_number, None)
+            self.save_quarantined_orders()
+            return None
+
+    def check_all_dart_data_csv(self, interactive=True):
+        # Check if all_dart_data.csv is available, if the user can't be asked (interactive is False), the data is always (re-)gathered:
+        if not interactive:
+            user_decision = "yes"
+            print("running non-interactively, gathering the data...")
+            logging.info("running non-interactively, all_dart_data.csv will be (re-)gathered.")
+
+        elif os.path.exists(os.path.join(self.data_root, 'all_dart_data.csv')):
             print("\n >>> latest dart order number: ", max(self.dart_file_dict.keys()))
 
             # Function to ask the user for their choice
@@ -531,115 +1075,169 @@ class dart():
 
         return user_decision
 
-    def iterate_DArT_data(self, user_decision = "no"):
+    def read_dart_order(self, dart_order_number):
+        """read in the Report file and, if available, the SampleFile/DArT_extract file of a single DArT order.
+        All sample names are extracted from the Report file and converted to upper case to match the Ninox naming conventions.
+        If a SampleFile/DArT_extract file is available, its "Genotype" column contains the Sample Name, which is used for matching,
+        and its "Tissue" column is added. Returns a dataframe with the columns sample_names, dart_order_number and tissue,
+        or None if no Report file is available for this DArT order.
+        The summary statistics of the order (samples in Report and SampleFile, samples of either file lost in the merge of both, tissue mix) 
+        are computed in the same pass and kept in self.dart_order_stats.
+        """
+        # extract the filenames from the dart_file_dict:
+        report_filenames = self.dart_file_dict[dart_order_number]["report_files"]
+
+        if dart_order_number in self.report_headers:
+            # the Report file header has already been found by validate_dart_orders(), read in the whole file skipping the first n rows:
+            report_header = self.report_headers[dart_order_number]
+            report_filename = report_header["report_filename"]
+            print("\n\n >>> report_filename: ", report_filename)
+            report_file = read_csv_engine(self.data_root + "/DArT/" + dart_order_number + "/" + report_filename, skiprows=report_header["row_number"], header=None, low_memory=False)
+            row_7 = report_file.iloc[0]
+            repavg_column = report_header["repavg_column"]
+            print("----- repavg_column: ", repavg_column)
+            # extract all values from row_7 after the index of "RepAvg", which corresponds to all sample names, converted to upper case:
+            sample_names = row_7.iloc[repavg_column+1:].str.upper()
+            print(f"----- length of sample_names from Report for {dart_order_number}: ", len(sample_names))
+        elif not report_filenames == "no Report file available":
+            # select the report file with the shorter filename if there are more than 1:
+            if len(report_filenames) > 1:
+                report_filename = min(report_filenames, key=len)
+            else:
+                report_filename = report_filenames[0]
+            print("\n\n >>> report_filename: ", report_filename)
+
+            # READ THE REPORT FILE:
+            # read in the first 10 rows of the report file, find the row number of where the first column entry says AlleleID.
+            # This is the row where the actual data starts, but it varies between DArT orders.
+            # Use that row number to read in the whole file again, but skip the first n rows.
+            report_file = pd.read_csv(self.data_root + "/DArT/" + dart_order_number + "/" + report_filename, nrows=10, header=None, low_memory=False)
+            # find the row number of the row where the first column entry says AlleleID or from DKo22-7008 onwards MarkerName:
+            row_number = report_file[report_file.iloc[:,0].isin(["AlleleID", "MarkerName"])].index[0]
+            # read in the whole file again, but skip the first n rows:
+            report_file = read_csv_engine(self.data_root + "/DArT/" + dart_order_number + "/" + report_filename, skiprows=row_number, header=None, low_memory=False)
+            # Get row 0 (indexing starts at 0, so we use index 0) as first 6 rows are skipped at reading in:
+            row_7 = report_file.iloc[0]
+            # Find the column where "RepAvg" or from DKo22-7008 onwards "RatioAvgCountRefAvgCountSnp" appears
+            repavg_column = row_7[row_7.isin(["RepAvg", "RatioAvgCountRefAvgCountSnp"])].index[0]
+            print("----- repavg_column: ", repavg_column)
+            # extract all values from row_7 after the index of "RepAvg", which corresponds to all sample names:
+            sample_names = row_7.iloc[repavg_column+1:]
+            # convert all sample names to upper case:
+            sample_names = sample_names.str.upper()
+            # print length of sample_names:
+            print(f"----- length of sample_names from Report for {dart_order_number}: ", len(sample_names))
+        else:
+            print("no Report available for ", dart_order_number)
+            self.dart_order_stats.pop(dart_order_number, None)
+            return None
+
+        # The report sample df should contain all two columns: sample names and the DArT order number. 
+        report_samples_df = pd.DataFrame(columns=["sample_names", "dart_order_number"])
+        report_samples_df["sample_names"] = sample_names
+        report_samples_df["dart_order_number"] = dart_order_number
+
+        # READ THE SAMPLE FILE/DArT_extract FILE:
+        sample_filename = self.dart_file_dict[dart_order_number]["sample_file"]
+        print("\n >>> sample_filename: ", sample_filename)
+        if not sample_filename == "no SampleFile available":
+            sample_file = read_csv_engine(self.data_root + "/DArT/" + dart_order_number + "/" + sample_filename)
+            # print length of sample_file:
+            print(f"----- length of sample_file from SampleFile for {dart_order_number}: ", len(sample_file))
+
+            # The sample file df should contain all three columns: sample names, DArT order number and Tissue.
+            # These shall then be used to match the sample names between each other. 
+            sample_file_df = pd.DataFrame(columns=["sample_names", "tissue"])
+            # convert all sample names to upper case:
+            # numeric sample names are read in as numbers, cast them to str first (missing names stay missing):
+            sample_file_df["sample_names"] = sample_file["Genotype"].astype(str).str.upper().where(sample_file["Genotype"].notna())
+            sample_file_df["tissue"] = sample_file["Tissue"]
+            # match the sample names between the two dataframes and merge them:
+            dart_data = report_samples_df.merge(sample_file_df, how="inner", on="sample_names")
+            # print length of dart_data:
+            print(f"----- length of dart_data for {dart_order_number}: ", len(dart_data))
+            n_samples_in_samplefile = len(sample_file_df)
+            # samples of either file which are not in the other file are lost in the inner merge:
+            n_report_samples_not_in_samplefile = int((~report_samples_df["sample_names"].isin(sample_file_df["sample_names"])).sum())
+            n_samplefile_samples_not_in_report = int((~sample_file_df["sample_names"].isin(report_samples_df["sample_names"])).sum())
+        else:
+            # print to log that no SampleFile is available for this DArT order, hence only Report samples will be used to match DArT order numbers to Ninox sample names.
+            logging.info(f"no SampleFile available for {dart_order_number}, hence only Report samples will be used to match DArT order numbers to Ninox sample names.")
+            print("----- no SampleFile available for ", dart_order_number)
+            # no metadata available, only Report samples will be used to match DArT order numbers to Ninox sample names.
+            dart_data = report_samples_df
+            # append column tissue type with NA:
+            dart_data["tissue"] = "NA"
+            n_samples_in_samplefile = 0
+            n_report_samples_not_in_samplefile = 0
+            n_samplefile_samples_not_in_report = 0
+
+        self.dart_order_stats[dart_order_number] = {"dart_order_number": dart_order_number,
+                                                    "report_file": report_filename,
+                                                    "sample_file": sample_filename,
+                                                    "samples_in_report": int(len(report_samples_df)),
+                                                    "samples_in_samplefile": int(n_samples_in_samplefile),
+                                                    "report_samples_not_in_samplefile": n_report_samples_not_in_samplefile,
+                                                    "samplefile_samples_not_in_report": n_samplefile_samples_not_in_report,
+                                                    "samples_in_dart_data": int(len(dart_data)),
+                                                    "tissue_mix": json.dumps({str(tissue): int(count) for tissue, count in dart_data["tissue"].value_counts(dropna=False).items()})}
+        logging.info(f"stats for DArT order {dart_order_number}: {json.dumps(self.dart_order_stats[dart_order_number])}")
+        return dart_data
+
+    def save_dart_order_stats(self):
+        """save the summary statistics of all DArT orders in self.dart_file_dict to dart_merged/dart_order_stats.csv."""
+        dart_order_stats = pd.DataFrame([self.dart_order_stats[dart_order_number] for dart_order_number in self.dart_file_dict if dart_order_number in self.dart_order_stats],
+                                        columns=["dart_order_number", "report_file", "sample_file", "samples_in_report", "samples_in_samplefile", 
+                                                 "report_samples_not_in_samplefile", "samplefile_samples_not_in_report", "samples_in_dart_data", "tissue_mix"])
+        os.makedirs(os.path.join(self.data_root, "dart_merged"), exist_ok=True)
+        atomic_to_csv(dart_order_stats, os.path.join(self.data_root, "dart_merged", "dart_order_stats.csv"), index=False)
+        return dart_order_stats
+
+    def iterate_DArT_data(self, user_decision = "no", journal=None):
         """iterate through all folders in dart_data directory which follow the DArT order naming convention DKoXX-XXXX, with X being numbers. 
-        Create a new pandas dataframe for each DArT order.
-        Then the Report file will be read and all sample names extracted as well as converted to upper case to match the Ninox naming conventions.
-        In this function we need to extract all DArT sample names and if DArT-extract or SampleFile are available also extract
-        the Tissue column.
-        In these metadata files the "Genotype" column contains the Sample Name, which will be used for matching.
+        Each DArT order is read in by read_dart_order() and all orders are concatenated into all_dart_data.
+        If a run journal is given, each finished DArT order is checkpointed to dart_merged/orders/<dart order number>.csv, 
+        so a restarted run reads the checkpoint instead of parsing the Report file again.
         """
         
         if user_decision == "yes":    
             print('all_dart_data.csv is not available or should be overwritten, re-gathering the data...')
-            all_dart_data = pd.DataFrame(columns=["sample_names", "dart_order_number", "tissue"])
+            dart_data_list = [pd.DataFrame(columns=["sample_names", "dart_order_number", "tissue"])]
+            n_all_dart_data = 0
             # iterate through DArT orders:
-            for item in self.dart_file_dict:
-                # create a new pandas dataframe for each DArT order:
-                dart_data = pd.DataFrame(columns=["dart_order_number", "sample_names", "sample_file"])
-                # extract the dart order number from the folder name:
-                dart_order_number = item
-                # extract the filenames from the dart_file_dict:
-                report_filenames = self.dart_file_dict[item]["report_files"]
-
-                if not report_filenames == "no Report file available":
-                    # select the report file with the shorter filename if there are more than 1:
-                    if len(report_filenames) > 1:
-                        report_filename = min(report_filenames, key=len)
-                    else:
-                        report_filename = report_filenames[0]
-                    print("\n\n >>> report_filename: ", report_filename)
-
-                    # READ THE REPORT FILE:
-                    # read in the first 10 rows of the report file, find the row number of where the first column entry says AlleleID.
-                    # This is the row where the actual data starts, but it varies between DArT orders.
-                    # Use that row number to read in the whole file again, but skip the first n rows.
-                    report_file = pd.read_csv(os.getcwd() + "/DArT/" + dart_order_number + "/" + report_filename, nrows=10, header=None, low_memory=False)
-                    # find the row number of the row where the first column entry says AlleleID or from DKo22-7008 onwards MarkerName:
-                    row_number = report_file[report_file.iloc[:,0].isin(["AlleleID", "MarkerName"])].index[0]
-                    # read in the whole file again, but skip the first n rows:
-                    report_file = pd.read_csv(os.getcwd() + "/DArT/" + dart_order_number + "/" + report_filename, skiprows=row_number, header=None, low_memory=False)
-                    # Get row 0 (indexing starts at 0, so we use index 0) as first 6 rows are skipped at reading in:
-                    row_7 = report_file.iloc[0]
-                    # Find the column where "RepAvg" or from DKo22-7008 onwards "RatioAvgCountRefAvgCountSnp" appears
-                    repavg_column = row_7[row_7.isin(["RepAvg", "RatioAvgCountRefAvgCountSnp"])].index[0]
-                    print("----- repavg_column: ", repavg_column)
-                    # extract all values from row_7 after the index of "RepAvg", which corresponds to all sample names:
-                    sample_names = row_7.iloc[repavg_column+1:]
-                    # convert all sample names to upper case:
-                    sample_names = sample_names.str.upper()
-                    # print length of sample_names:
-                    print(f"----- length of sample_names from Report for {dart_order_number}: ", len(sample_names))
+            # iterate over a copy, orders which fail to be read in are removed from self.dart_file_dict:
+            for dart_order_number in list(self.dart_file_dict):
+                checkpoint_file = journal.dart_order_checkpoint(dart_order_number) if journal is not None else None
+                if checkpoint_file is not None:
+                    # this order was already finished by an interrupted run, read in its checkpoint:
+                    print(f"\n\n >>> {dart_order_number} read from checkpoint {checkpoint_file}")
+                    dart_data = read_csv_engine(checkpoint_file, dtype={"tissue": str}, keep_default_na=False)
+                    self.dart_order_stats[dart_order_number] = journal.dart_order_stats(dart_order_number)
                 else:
-                    print("no Report available for ", dart_order_number)
-                    continue    # move on to the next DArT order if there is no Report file available.
-
-                # READ THE SAMPLE FILE/DArT_extract FILE:
-                sample_filename = self.dart_file_dict[item]["sample_file"]
-                print("\n >>> sample_filename: ", sample_filename)
-                if not sample_filename == "no SampleFile available":
-                    sample_file = pd.read_csv(os.getcwd() + "/DArT/" + dart_order_number + "/" + sample_filename)
-                    # convert all sample names to upper case:
-                    sample_file["Genotype"] = sample_file["Genotype"].str.upper()
-                    # print length of sample_file:
-                    print(f"----- length of sample_file from SampleFile for {dart_order_number}: ", len(sample_file))
-
-                    # The report sample df should contain all two columns: sample names and the DArT order number. 
-                    # The sample file df should contain all three columns: sample names, DArT order number and Tissue.
-                    # These shall then be used to match the sample names between each other. 
-                    # now create a new dataframe for each list of sample names:
-                    report_samples_df = pd.DataFrame(columns=["sample_names", "dart_order_number"])
-                    report_samples_df["sample_names"] = sample_names
-                    report_samples_df["dart_order_number"] = dart_order_number
-
-                    sample_file_df = pd.DataFrame(columns=["sample_names", "tissue"])
-                    sample_file_df["sample_names"] = sample_file["Genotype"]
-                    # convert all sample names to upper case:
-                    sample_file_df["sample_names"] = sample_file_df["sample_names"].str.upper()
-                    sample_file_df["tissue"] = sample_file["Tissue"]
-                    # match the sample names between the two dataframes and merge them:
-                    dart_data = report_samples_df.merge(sample_file_df, how="inner", on="sample_names")
-                    # print length of dart_data:
-                    print(f"----- length of dart_data for {dart_order_number}: ", len(dart_data))
-
-                    # append dart_data to all_dart_data:
-                    all_dart_data = pd.concat([all_dart_data, dart_data], ignore_index=True)
-                    # print length of all_dart_data:
-                    print(f"new length of all_dart_data for {dart_order_number}: ", len(all_dart_data))
-                else:
-                    # print to log that no SampleFile is available for this DArT order, hence only Report samples will be used to match DArT order numbers to Ninox sample names.
-                    logging.info(f"no SampleFile available for {dart_order_number}, hence only Report samples will be used to match DArT order numbers to Ninox sample names.")
-                    print("----- no SampleFile available for ", dart_order_number)
-                    # no metadata available, only Report samples will be used to match DArT order numbers to Ninox sample names.
-                    report_samples_df = pd.DataFrame(columns=["sample_names", "dart_order_number"])
-                    report_samples_df["sample_names"] = sample_names
-                    report_samples_df["dart_order_number"] = dart_order_number
-
-                    dart_data = report_samples_df
-                    # append column tissue type with NA:
-                    dart_data["tissue"] = "NA"
-                    # append dart_data to all_dart_data:
-                    all_dart_data = pd.concat([all_dart_data, dart_data], ignore_index=True)
-                     # print length of all_dart_data:
-                    print(f"new length of all_dart_data for {dart_order_number}: ", len(all_dart_data))
+                    dart_data = self.ingest_dart_order(dart_order_number)
+                    if dart_data is None:
+                        continue    # move on to the next DArT order if there is no Report file available or the order was quarantined.
+                    if journal is not None:
+                        journal.save_dart_order(dart_order_number, dart_data, self.dart_order_stats[dart_order_number])
+
+                # append dart_data to all_dart_data:
+                dart_data_list.append(dart_data)
+                n_all_dart_data += len(dart_data)
+                # print length of all_dart_data:
+                print(f"new length of all_dart_data for {dart_order_number}: ", n_all_dart_data)
+
+            # concatenate all DArT orders at once:
+            all_dart_data = pd.concat(dart_data_list, ignore_index=True)
                     
             #extract all sample names from all_dart_data:
             self.l_all_dart_samples = all_dart_data["sample_names"].tolist()
 
             # save all_dart_data to csv file:
             # if the dart_merged directory is not yet available, create it:
-            os.makedirs("dart_merged", exist_ok=True)
-            all_dart_data.to_csv(os.getcwd() + "/dart_merged/all_dart_data.csv", index=False)
+            os.makedirs(os.path.join(self.data_root, "dart_merged"), exist_ok=True)
+            atomic_to_csv(all_dart_data, self.data_root + "/dart_merged/all_dart_data.csv", index=False)
+            # save the summary statistics of all DArT orders:
+            self.save_dart_order_stats()
             
         elif user_decision == "no":
             # print to console and log that all_dart_data.csv will be used for merging with ninox, as DArT orders included are up to date.
@@ -650,7 +1248,9 @@ class dart():
     
 
 class combine_dart_ninox():
-    def __init__(self):
+    def __init__(self, data_root=None):
+        # data_root is the folder holding the ninox_merged and dart_merged folders of one site, by default the current working directory:
+        self.data_root = data_root if data_root is not None else os.getcwd()
         self.combined_data = pd.DataFrame()
         return
 
@@ -658,9 +1258,9 @@ class combine_dart_ninox():
         """
         this function reads in the ninox_merged file and the all_dart_data file and combines them into a new file."""
         # read in the ninox_merged file:
-        ninox_merged = pd.read_csv(os.getcwd() + "/ninox_merged/ninox_merged.csv")
+        ninox_merged = read_csv_engine(self.data_root + "/ninox_merged/ninox_merged.csv")
         # read in the all_dart_data file:
-        all_dart_data = pd.read_csv(os.getcwd() + "/dart_merged/all_dart_data.csv")
+        all_dart_data = read_csv_engine(self.data_root + "/dart_merged/all_dart_data.csv")
 
         # print all unique DArt.Order.Numbers from ninox_merged to console and log:
         print("unique DArt.Order.Numbers from ninox_merged: ", ninox_merged["Dart.Order.Number"].unique())
@@ -708,39 +1308,62 @@ class combine_dart_ninox():
         TODO: clean up and rename columns, some are double as they were taken from multiple sources.
         then save combined data
         """
-        # group the combined data by dart order and count the number of samples, use the DArT data as reference, as it is more complete and was matched to the exisitng ninox data:
-        dart_groups = self.combined_data.groupby("dart_order_number").count()
+        # count the number of samples per dart order, use the DArT data as reference, as it is more complete and was matched to the exisitng ninox data:
+        dart_groups = self.combined_data["dart_order_number"].value_counts().sort_index().rename("samples_matched_to_ninox")
         # print dart_groups:
         print("dart_groups: \n", dart_groups)
         # save dart_groups to a log file, print only the DAart order number and the number of samples for that order number:
-        logging.info(f"dart_groups: \n {dart_groups['Sample.Name']}")
+        logging.info(f"dart_groups: \n {dart_groups}")
+
+        # the QC report per DArT order comes from the summary statistics computed while the DArT orders were read in:
+        stats_file = os.path.join(self.data_root, "dart_merged", "dart_order_stats.csv")
+        if os.path.isfile(stats_file):
+            dart_order_qc = pd.read_csv(stats_file).merge(dart_groups, how="left", left_on="dart_order_number", right_index=True)
+            dart_order_qc["samples_matched_to_ninox"] = dart_order_qc["samples_matched_to_ninox"].fillna(0).astype(int)
+            print("dart_order_qc: \n", dart_order_qc.drop(columns=["report_file", "sample_file"]))
+            logging.info(f"dart_order_qc: \n {dart_order_qc.drop(columns=['report_file', 'sample_file']).to_string(index=False)}")
+            atomic_to_csv(dart_order_qc, os.path.join(self.data_root, "dart_merged", "dart_order_qc.csv"), index=False)
 
 
          # save combined_data to csv file:
-        self.combined_data.to_csv(os.getcwd() + "/dart_merged/combined_ninox_and_dart_data.csv", index=False)
+        atomic_to_csv(self.combined_data, self.data_root + "/dart_merged/combined_ninox_and_dart_data.csv", index=False)
         return
     
 
 
 ######################################################
-### MAIN SCRIPT ###
+### PIPELINE FOR ONE SITE AND MULTI-SITE SHARDS ###
 ######################################################
-skip_ninox = False   # set to True if the ninox data has already been downloaded and is up to date and only handle the DArT data.
-if __name__ == "__main__":
-    ### create a new log file calles logfile.log, or if it exists already append to it.
-    ### print a start of script line with Date and Time to log file to see when the script was started.
-    logging.basicConfig(filename='logfile.log', level=logging.INFO, format='%(asctime)s %(message)s')
-    logging.info(f"\n\n>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>\nStart of script: combine_dart_and_ninox_samples_2.py")
-    # write skip_ninox to log file:
-    logging.info(f"boolean skip_ninox: {skip_ninox}")
+# Several regional programs can be processed in one run. Their data roots are configured in a sites file (json), e.g.:
+# {"sites": {"SEQ": "/data/seq", "NSW": "/data/nsw"}, "workers": 2, "rollup_dir": "/data/all_sites"}
+# Each data root holds its own ninox, DArT, ninox_merged and dart_merged folders and logfile.log.
+# The sites are processed as parallel shards, if rollup_dir is given the combined tables and 
+# the sample to DArT order indexes (all_dart_data.csv) of all sites are merged into it afterwards.
+
+def merge_ninox_surveys(data_root, schema_registry, survey_types, journal=None):
+    """merge the Genetics and Extractions data of the given survey types individually and then all survey types into ninox_merged.csv.
+    If a run journal is given, survey types which were already merged by an interrupted run are skipped."""
+    ninox_filedict = schema_registry.ninox_filedict
+    if journal is not None:
+        # survey types which were already merged by the interrupted run, merging them again would append their new samples twice:
+        merged_survey_types = [survey_type for survey_type in survey_types if journal.is_done(f"ninox_survey_{survey_type}")]
+        for survey_type in merged_survey_types:
+            print(f"survey type {survey_type} was already merged, skipped.")
+            logging.info(f"survey type {survey_type} was already merged by the interrupted run, skipped.")
+        survey_types = [survey_type for survey_type in survey_types if survey_type not in merged_survey_types]
+        if len(survey_types) == 0 and journal.is_done("ninox_merged"):
+            # all ninox stages are finished, there is no need to read in ninox_merged.csv for its currency:
+            print("all ninox data was already merged by the interrupted run, skipped.")
+            logging.info("all ninox data was already merged by the interrupted run, skipped.")
+            return
 
     # handle the ninox data:
     # get the data status of the ninox_merged data (all survey types combined), 
     # if it's true (ninox_merged.csv already exists) only newer samples than ninox_merged currency will be handled in survye_type,
     # else assemble the data from scratch, this functionality is implemented within the ninox_survey class.:
-    ninox_all = ninox_all(ninox_filedict=ninox_filedict)
-    ninox_data_status = ninox_all.determine_data_status()
-    ninox_all_currency = ninox_all.test_currency()
+    ninox_all_data = ninox_all(ninox_filedict=ninox_filedict, data_root=data_root)
+    ninox_data_status = ninox_all_data.determine_data_status()
+    ninox_all_currency = ninox_all_data.test_currency()
 
     #print data status and currency to log file:
     logging.info(f"ninox_data_status: {ninox_data_status}")
@@ -749,32 +1372,15 @@ if __name__ == "__main__":
     print(f"ninox_data_status: {ninox_data_status}")
     print(f"ninox_all_currency: {ninox_all_currency}")
 
-    # initiate a ninox class for each survey type to combine Genetics and Extraction data of each individually:
-    ninox_dog = ninox_survey(ninox_filedict=ninox_filedict, survey_type="Dog", ninox_all_currency=ninox_all_currency)
-    ninox_drone = ninox_survey(ninox_filedict=ninox_filedict, survey_type="Drone", ninox_all_currency=ninox_all_currency)
-    ninox_opportunistic = ninox_survey(ninox_filedict=ninox_filedict, survey_type="Opportunistic", ninox_all_currency=ninox_all_currency)
-    ninox_tracking = ninox_survey(ninox_filedict=ninox_filedict, survey_type="Tracking", ninox_all_currency=ninox_all_currency)
-    ninox_partner = ninox_survey(ninox_filedict=ninox_filedict, survey_type="Partner", ninox_all_currency=ninox_all_currency)
-
-    # read in the Genetics and Extractions data for each survey type:
-    ninox_dog.read_Genetics()
-    ninox_remerge_survey_dog = ninox_dog.read_Extractions()
-    ninox_drone.read_Genetics()
-    ninox_remerge_survey_drone = ninox_drone.read_Extractions()
-    ninox_opportunistic.read_Genetics()
-    ninox_remerge_survey_opportunistic = ninox_opportunistic.read_Extractions()
-    ninox_tracking.read_Genetics()
-    ninox_remerge_survey_tracking = ninox_tracking.read_Extractions()
-    ninox_partner.read_Genetics()
-    ninox_remerge_survey_partner = ninox_partner.read_Extractions()
-
+    # initiate a ninox class for each survey type in the schema to combine Genetics and Extraction data of each individually,
+    # read in the Genetics and Extractions data for each survey type and
     # create a dict with all survey types, their class instances and the returned ninox_remerge_survey bools as {"survey_type": {"class": ninox_survey_type, "bool": ninox_remerge_survey}}:
-    ninox_remerge_survey_dict = {"Dog": {"class": ninox_dog, "bool": ninox_remerge_survey_dog},
-                                "Drone": {"class": ninox_drone, "bool": ninox_remerge_survey_drone},
-                                "Opportunistic": {"class": ninox_opportunistic, "bool": ninox_remerge_survey_opportunistic},
-                                "Tracking": {"class": ninox_tracking, "bool": ninox_remerge_survey_tracking},
-                                "Partner": {"class": ninox_partner, "bool": ninox_remerge_survey_partner}
-                                }
+    ninox_remerge_survey_dict = {}
+    for survey_type in survey_types:
+        ninox_survey_type = ninox_survey(schema_registry=schema_registry, survey_type=survey_type, ninox_all_currency=ninox_all_currency, data_root=data_root)
+        ninox_survey_type.read_Genetics()
+        ninox_remerge_survey = ninox_survey_type.read_Extractions()
+        ninox_remerge_survey_dict[survey_type] = {"class": ninox_survey_type, "bool": ninox_remerge_survey}
     # print only keys and bools, but not class from ninox_remerge_survey_dict to log file in a nice json format:
     logging.info(f"ninox_remerge_survey_dict: \n {json.dumps({key: value['bool'] for key, value in ninox_remerge_survey_dict.items()}, indent=4)}")
 
@@ -789,29 +1395,364 @@ if __name__ == "__main__":
         # print to log file that ninox_remerge_survey is True for survey type: {survey_type}:
         logging.info(f"ninox_remerge_survey is {ninox_remerge_survey} for survey type: {survey_type}, merged ninox data for this survey type will be saved.")
         if ninox_remerge_survey:
+            if journal is not None:
+                journal.stage_pending(f"ninox_survey_{survey_type}", os.path.join(data_root, "ninox_merged", f"ninox_merged_{survey_type}.csv"))
             # merge the ninox data for each survey type individually:
             ninox_survey_type.merge_ninox_data_survey()
         else:
             # print to log file that ninox_remerge_survey is False for survey type: {survey_type}:
             logging.info(f"ninox_remerge_survey is {ninox_remerge_survey} for survey type: {survey_type}, no new data was saved.")
+        if journal is not None:
+            journal.stage_done(f"ninox_survey_{survey_type}")
 
     print("\n\n>> individual survey types of ninox data handling finished <<")
     print(">> now merging all survey types into one large ninox_merged file ... <<\n\n")
     # now merge all ninox data for all survey types into one file:
     # if data status is True (ninox_merged.csv already exists) only newer samples than ninox_merged currency will be appended for each survey type.
-    ninox_all.merge_ninox_data_all()
-            
+    if journal is None:
+        ninox_all_data.merge_ninox_data_all()
+    elif not journal.is_done("ninox_merged"):
+        journal.stage_pending("ninox_merged", os.path.join(data_root, "ninox_merged", "ninox_merged.csv"))
+        ninox_all_data.merge_ninox_data_all()
+        journal.stage_done("ninox_merged")
+    return
+
+
+def run_pipeline(data_root, schema_registry, interactive=True, dart_data=None, fresh=False):
+    """run the whole pipeline for the site in data_root: merge the ninox data, gather the DArT data and combine both.
+    If interactive is False the user is never asked whether the DArT data should be re-gathered.
+    If a dart instance is given as dart_data, it is used for the DArT data, so the caller can keep it afterwards.
+    Finished stages are checkpointed in the run journal, if the last run in data_root was interrupted it is resumed, unless fresh is True.
+    Raises a RuntimeError if another process is running the pipeline for data_root.
+    Returns a dict with the paths of the combined data and the sample to DArT order index of this site."""
+    # write data root and skip_ninox to log file:
+    logging.info(f"data root: {data_root}")
+    logging.info(f"boolean skip_ninox: {skip_ninox}")
 
-    # now handle the DArT data:
-    print("\n\n>> now handling DArT data ... <<\n\n")
-    dart = dart()
-    dart.create_dart_file_dict()
-    user_decision = dart.check_all_dart_data_csv()  # check if all_dart_data.csv is available, if not ask user if they want to re-gather the data.
-    dart.iterate_DArT_data(user_decision)
-
-    # combine the ninox and DArT data:
-    print("\n\n>> now combining ninox and DArT data ... <<\n\n")
-    combine_dart_ninox = combine_dart_ninox()
-    combine_dart_ninox.initial_combination()
-    combine_dart_ninox.check_data_and_count_unmatched_samples()
-     
+    # start a new run journal or resume the interrupted last run, this takes the lock of the data root:
+    journal = run_journal(data_root)
+    journal.start(fresh=fresh)
+    try:
+        # pre-flight validation of all DArT orders before the heavy stages run, malformed orders are quarantined:
+        print("\n\n>> validating DArT orders ... <<\n\n")
+        if dart_data is None:
+            dart_data = dart(data_root=data_root)
+        dart_data.create_dart_file_dict()
+        dart_data.validate_dart_orders()
+
+        # handle the ninox data of all survey types:
+        merge_ninox_surveys(data_root, schema_registry, list(schema_registry.ninox_filedict), journal=journal)
+
+        # now handle the DArT data:
+        print("\n\n>> now handling DArT data ... <<\n\n")
+        if not journal.is_done("dart_data"):
+            user_decision = dart_data.check_all_dart_data_csv(interactive=interactive)  # check if all_dart_data.csv is available, if not ask user if they want to re-gather the data.
+            # finished DArT orders are checkpointed in the run journal:
+            dart_data.iterate_DArT_data(user_decision, journal=journal)
+            journal.stage_done("dart_data")
+
+        # combine the ninox and DArT data:
+        print("\n\n>> now combining ninox and DArT data ... <<\n\n")
+        if not journal.is_done("combined"):
+            combined_data = combine_dart_ninox(data_root=data_root)
+            combined_data.initial_combination()
+            combined_data.check_data_and_count_unmatched_samples()
+            journal.stage_done("combined")
+
+        # all stages finished, the next run starts from scratch:
+        journal.finish()
+    finally:
+        # release the lock if a stage failed, the journal stays "running" and the next run resumes it:
+        journal.stop()
+
+    return {"data_root": data_root, 
+            "combined_file": os.path.join(data_root, "dart_merged", "combined_ninox_and_dart_data.csv"),
+            "dart_index_file": os.path.join(data_root, "dart_merged", "all_dart_data.csv")}
+
+
+def run_shard(site, data_root, schema_file=ninox_schema_file, fresh=False):
+    """run the pipeline for one site as a shard in a worker process. 
+    Each shard logs to the logfile.log in its own data root and never asks the user for input."""
+    logging.basicConfig(filename=os.path.join(data_root, 'logfile.log'), level=logging.INFO, format='%(asctime)s %(message)s', force=True)
+    logging.info(f"\n\n>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>\nStart of shard for site {site}: combine_dart_and_ninox_samples_2.py")
+    # the csv engine selected in the main process is passed on by the environment variable:
+    set_csv_engine(csv_engine)
+    schema_registry = ninox_schema_registry(schema_file)
+    shard_result = run_pipeline(data_root, schema_registry, interactive=False, fresh=fresh)
+    shard_result["site"] = site
+    return shard_result
+
+
+def run_sites(sites, schema_file=ninox_schema_file, workers=None, fresh=False):
+    """process all sites ({site: data_root}) as parallel shards, one worker process per shard up to workers.
+    A failing site is logged and doesn't stop the other sites. Returns the results of all finished shards and the names of all failed sites."""
+    shard_results = []
+    failed_sites = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_shard, site, data_root, schema_file, fresh): site for site, data_root in sites.items()}
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                shard_results.append(future.result())
+                print(f"site {site} finished.")
+                logging.info(f"site {site} finished.")
+            except Exception as error:
+                print(f"site {site} failed: {error}")
+                logging.exception(f"site {site} failed: {error}")
+                failed_sites.append(site)
+    return shard_results, sorted(failed_sites)
+
+
+def rollup_sites(shard_results, rollup_dir):
+    """merge the combined ninox and DArT data and the sample to DArT order indexes (all_dart_data.csv) of all finished sites 
+    into one file each in rollup_dir. A column "site" is added to tell the sites apart."""
+    os.makedirs(rollup_dir, exist_ok=True)
+    for file_key, rollup_filename in [("combined_file", "combined_ninox_and_dart_data_all_sites.csv"), ("dart_index_file", "all_dart_data_all_sites.csv")]:
+        site_data_list = []
+        for shard_result in sorted(shard_results, key=lambda shard_result: shard_result["site"]):
+            if not os.path.isfile(shard_result[file_key]):
+                logging.info(f"{shard_result[file_key]} not available for site {shard_result['site']}, it is not included in the rollup.")
+                continue
+            site_data = read_csv_engine(shard_result[file_key], low_memory=False)
+            site_data.insert(0, "site", shard_result["site"])
+            site_data_list.append(site_data)
+        if len(site_data_list) == 0:
+            continue
+        rollup_data = pd.concat(site_data_list, ignore_index=True)
+        atomic_to_csv(rollup_data, os.path.join(rollup_dir, rollup_filename), index=False)
+        # print shape of the rollup to console and log:
+        print(f"shape of {rollup_filename}: {rollup_data.shape}")
+        logging.info(f"shape of {rollup_filename}: {rollup_data.shape}")
+    return
+
+
+######################################################
+### WATCH MODE ###
+######################################################
+class data_root_watcher():
+    """class to keep the pipeline running for one data root and react to new DArT orders and Ninox exports.
+    The DArT/DKo* folders and the Ninox export files of all survey types in the schema are watched, 
+    with inotify if inotify_simple is installed, otherwise by polling the modification times every poll_interval seconds.
+    Changes are debounced: they are only handled once no file changed for debounce seconds, so half-copied files aren't read.
+    Only the affected survey types and DArT orders are reprocessed, followed by the combination of ninox and DArT data.
+    The snapshot of a survey type or DArT order is only updated once its changes were handled, so failed changes are retried with the next poll.
+    The data of all DArT orders is kept in memory (self.dart_orders_data), so unchanged orders are never read again.
+    While changes are handled the lock of the data root is held, so the outputs aren't written at the same time by another run.
+    """
+    def __init__(self, data_root, schema_registry, poll_interval=30, debounce=10, fresh=False) -> None:
+        self.data_root = data_root
+        self.schema_registry = schema_registry
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.fresh = fresh
+        self.lock = data_root_lock(data_root)
+        self.dart_data = dart(data_root=data_root)
+        self.dart_orders_data = {}
+        self.snapshot = {}
+        self.combine_pending = False
+        self.inotify = None
+        self.watched_folders = set()
+        if INotify is not None:
+            self.inotify = INotify()
+        pass
+
+    def take_snapshot(self):
+        """returns the modification time and size of all watched files, keyed by ("ninox", survey_type) or ("dart", dart_order_number)."""
+        snapshot = {}
+        ninox_folder = os.path.join(self.data_root, "ninox")
+        for survey_type, survey_files in self.schema_registry.ninox_filedict.items():
+            file_stats = []
+            for filename in survey_files.values():
+                file_path = os.path.join(ninox_folder, filename)
+                try:
+                    file_stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                file_stats.append((filename, file_stat.st_mtime_ns, file_stat.st_size))
+            snapshot[("ninox", survey_type)] = tuple(file_stats)
+        for folder in glob.glob(os.path.join(self.data_root, "DArT", "DKo[0-9]*")):
+            dart_order_number = os.path.basename(folder)
+            file_stats = []
+            for file_path in sorted(glob.glob(os.path.join(folder, "*"))):
+                try:
+                    file_stat = os.stat(file_path)
+                except FileNotFoundError:
+                    # the file was removed after the glob:
+                    continue
+                file_stats.append((os.path.basename(file_path), file_stat.st_mtime_ns, file_stat.st_size))
+            snapshot[("dart", dart_order_number)] = tuple(file_stats)
+        return snapshot
+
+    def add_inotify_watches(self):
+        """add inotify watches for the ninox folder, the DArT folder and all DArT order folders which aren't watched yet."""
+        if self.inotify is None:
+            return
+        watch_flags = inotify_flags.CREATE | inotify_flags.CLOSE_WRITE | inotify_flags.MODIFY | inotify_flags.DELETE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+        folders = [os.path.join(self.data_root, "ninox"), os.path.join(self.data_root, "DArT")]
+        folders.extend(glob.glob(os.path.join(self.data_root, "DArT", "DKo[0-9]*")))
+        for folder in folders:
+            if folder not in self.watched_folders and os.path.isdir(folder):
+                self.inotify.add_watch(folder, watch_flags)
+                self.watched_folders.add(folder)
+        return
+
+    def wait(self, seconds):
+        """wait for seconds, or until inotify reports a change."""
+        if self.inotify is not None:
+            self.inotify.read(timeout=int(seconds * 1000))
+        else:
+            time.sleep(seconds)
+        return
+
+    def wait_for_changes(self):
+        """block until watched files changed and didn't change any further for self.debounce seconds,
+        or until the next poll if handling the last changes failed (self.snapshot wasn't updated for them).
+        Returns the changed survey types and DArT orders and the snapshot of the files."""
+        while True:
+            self.add_inotify_watches()
+            self.wait(self.poll_interval)
+            latest_snapshot = self.take_snapshot()
+            if latest_snapshot == self.snapshot and not self.combine_pending:
+                continue
+            # debounce: wait until the files are stable:
+            while True:
+                time.sleep(self.debounce)
+                stable_snapshot = self.take_snapshot()
+                if stable_snapshot == latest_snapshot:
+                    break
+                latest_snapshot = stable_snapshot
+            changed_keys = {key for key in set(self.snapshot) | set(latest_snapshot) if self.snapshot.get(key) != latest_snapshot.get(key)}
+            changed_survey_types = sorted(key[1] for key in changed_keys if key[0] == "ninox")
+            changed_dart_orders = sorted(key[1] for key in changed_keys if key[0] == "dart")
+            return changed_survey_types, changed_dart_orders, latest_snapshot
+
+    def commit_snapshot(self, kind, names, latest_snapshot):
+        """take over the snapshot of the survey types or DArT orders (kind "ninox" or "dart") in names once their changes were handled.
+        Changes which weren't handled successfully stay different from self.snapshot, so they are handled again with the next poll."""
+        for name in names:
+            if (kind, name) in latest_snapshot:
+                self.snapshot[(kind, name)] = latest_snapshot[(kind, name)]
+            else:
+                self.snapshot.pop((kind, name), None)
+        return
+
+    def initial_run(self):
+        """run the whole pipeline once and load the data of all DArT orders into memory."""
+        self.snapshot = self.take_snapshot()
+        # the pipeline fills self.dart_data with the DArT order files, header positions and summary statistics:
+        run_pipeline(self.data_root, self.schema_registry, interactive=False, dart_data=self.dart_data, fresh=self.fresh)
+        all_dart_data = read_csv_engine(os.path.join(self.data_root, "dart_merged", "all_dart_data.csv"), dtype={"tissue": str}, keep_default_na=False)
+        self.dart_orders_data = {dart_order_number: dart_order_data for dart_order_number, dart_order_data in all_dart_data.groupby("dart_order_number", sort=False)}
+        stats_file = os.path.join(self.data_root, "dart_merged", "dart_order_stats.csv")
+        if len(self.dart_data.dart_order_stats) == 0 and os.path.isfile(stats_file):
+            # the DArT data was gathered by an interrupted run which is resumed, load its summary statistics:
+            self.dart_data.dart_order_stats = {row["dart_order_number"]: row for row in pd.read_csv(stats_file).to_dict(orient="records")}
+        return
+
+    def update_dart_orders(self, dart_orders):
+        """read in the changed DArT orders again and rewrite all_dart_data.csv from the DArT orders kept in memory."""
+        self.dart_data.create_dart_file_dict()
+        self.dart_data.validate_dart_orders(dart_orders=dart_orders)
+        for dart_order_number in dart_orders:
+            self.dart_orders_data.pop(dart_order_number, None)
+            self.dart_data.dart_order_stats.pop(dart_order_number, None)
+            if dart_order_number not in self.dart_data.dart_file_dict:
+                # the DArT order folder was removed or the order is quarantined:
+                continue
+            dart_order_data = self.dart_data.ingest_dart_order(dart_order_number)
+            if dart_order_data is not None:
+                self.dart_orders_data[dart_order_number] = dart_order_data
+        # keep the order of the DArT orders as in dart_file_dict:
+        dart_data_list = [pd.DataFrame(columns=["sample_names", "dart_order_number", "tissue"])]
+        dart_data_list.extend(self.dart_orders_data[dart_order_number] for dart_order_number in self.dart_data.dart_file_dict if dart_order_number in self.dart_orders_data)
+        all_dart_data = pd.concat(dart_data_list, ignore_index=True)
+        self.dart_data.l_all_dart_samples = all_dart_data["sample_names"].tolist()
+        atomic_to_csv(all_dart_data, os.path.join(self.data_root, "dart_merged", "all_dart_data.csv"), index=False)
+        self.dart_data.save_dart_order_stats()
+        return
+
+    def run(self):
+        """run the pipeline once, then reprocess the affected parts whenever watched files change, until interrupted."""
+        print(f"\n\n>> watch mode for {self.data_root}, {'inotify' if self.inotify is not None else 'polling'} every {self.poll_interval} seconds <<\n\n")
+        logging.info(f"watch mode for {self.data_root}, inotify: {self.inotify is not None}, poll_interval: {self.poll_interval}, debounce: {self.debounce}")
+        self.initial_run()
+        while True:
+            changed_survey_types, changed_dart_orders, latest_snapshot = self.wait_for_changes()
+            print(f"\n\n>> changes detected, survey types: {changed_survey_types}, DArT orders: {changed_dart_orders} <<\n\n")
+            logging.info(f"watch mode: changes detected, survey types: {changed_survey_types}, DArT orders: {changed_dart_orders}, combination pending: {self.combine_pending}")
+            try:
+                # raises if another run is using the data root at the moment:
+                self.lock.acquire()
+                if len(changed_survey_types) > 0:
+                    merge_ninox_surveys(self.data_root, self.schema_registry, changed_survey_types)
+                    self.combine_pending = True
+                    self.commit_snapshot("ninox", changed_survey_types, latest_snapshot)
+                if len(changed_dart_orders) > 0:
+                    self.update_dart_orders(changed_dart_orders)
+                    self.combine_pending = True
+                    self.commit_snapshot("dart", changed_dart_orders, latest_snapshot)
+                combined_data = combine_dart_ninox(data_root=self.data_root)
+                combined_data.initial_combination()
+                combined_data.check_data_and_count_unmatched_samples()
+                self.combine_pending = False
+            except Exception as error:
+                # keep watching, the changes which weren't handled are handled again with the next poll:
+                print(f"handling the changes failed, retrying with the next poll: {error}")
+                logging.exception(f"watch mode: handling the changes failed, retrying with the next poll: {error}")
+            finally:
+                self.lock.release()
+        return
+
+
+######################################################
+### MAIN SCRIPT ###
+######################################################
+skip_ninox = False   # set to True if the ninox data has already been downloaded and is up to date and only handle the DArT data.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="combine the Ninox data for Koala genetic samples with the DArT data for the same samples.")
+    parser.add_argument("mode", nargs="?", choices=["run", "watch"], default="run", help="run the pipeline once (default) or keep watching for new DArT orders and Ninox exports.")
+    parser.add_argument("--sites", default=None, help="json file with the data roots of multiple sites, which are processed as parallel shards. By default only the current working directory is processed.")
+    parser.add_argument("--schema", default=ninox_schema_file, help="json file with the ninox survey type schema.")
+    parser.add_argument("--csv-engine", choices=csv_engines, default=csv_engine, help="CSV engine for the large reads, falls back to pandas if its dependency is missing.")
+    parser.add_argument("--poll-interval", type=float, default=30, help="watch mode: seconds between checks for changed files.")
+    parser.add_argument("--debounce", type=float, default=10, help="watch mode: seconds without further changes before changed files are handled.")
+    parser.add_argument("--fresh", action="store_true", help="don't resume an interrupted run, discard its journal and start from scratch.")
+    args = parser.parse_args()
+    if args.mode == "watch" and args.sites is not None:
+        parser.error("watch mode handles a single data root, --sites can't be used.")
+
+    ### create a new log file calles logfile.log, or if it exists already append to it.
+    ### print a start of script line with Date and Time to log file to see when the script was started.
+    logging.basicConfig(filename='logfile.log', level=logging.INFO, format='%(asctime)s %(message)s')
+    logging.info(f"\n\n>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>\nStart of script: combine_dart_and_ninox_samples_2.py")
+    set_csv_engine(args.csv_engine)
+
+    if args.mode == "watch":
+        # keep the schema and the DArT data in memory and handle changed files of the current working directory until interrupted:
+        schema_registry = ninox_schema_registry(args.schema)
+        watcher = data_root_watcher(os.getcwd(), schema_registry, poll_interval=args.poll_interval, debounce=args.debounce, fresh=args.fresh)
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            print("watch mode stopped.")
+            logging.info("watch mode stopped.")
+    elif args.sites is None:
+        # load the survey type schema and compile the column plans once, then handle the current working directory:
+        schema_registry = ninox_schema_registry(args.schema)
+        run_pipeline(os.getcwd(), schema_registry, fresh=args.fresh)
+    else:
+        with open(args.sites) as f:
+            sites_config = json.load(f)
+        # relative data roots are relative to the sites file:
+        sites_folder = os.path.dirname(os.path.abspath(args.sites))
+        sites = {site: os.path.join(sites_folder, data_root) for site, data_root in sites_config["sites"].items()}
+        logging.info(f"sites: \n {json.dumps(sites, indent=4)}")
+        shard_results, failed_sites = run_sites(sites, schema_file=args.schema, workers=sites_config.get("workers"), fresh=args.fresh)
+        if len(failed_sites) > 0:
+            # a rollup without the failed sites would look complete, so it isn't written:
+            print(f"sites failed: {failed_sites}, the rollup is skipped.")
+            logging.error(f"sites failed: {failed_sites}, the rollup is skipped.")
+            sys.exit(1)
+        if sites_config.get("rollup_dir"):
+            print("\n\n>> now merging the data of all sites ... <<\n\n")
+            rollup_sites(shard_results, os.path.join(sites_folder, sites_config["rollup_dir"]))